@@ -0,0 +1,90 @@
+import os
+from pathlib import Path
+from typing import Sequence, Union
+
+import numpy as np
+
+
+class MetricsWriter:
+    """
+    Append numeric metrics to chunked columnar shards during training.
+    Rows are kept in a preallocated buffer of ``chunk_size`` rows and written
+    to ``directory/part-XXXXX.{npz,csv}`` whenever the buffer is full, so
+    memory stays bounded and a killed run keeps every flushed shard.
+    """
+
+    FORMATS = ("npz", "csv")
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        columns: Sequence[str],
+        chunk_size: int = 10**4,
+        fmt: str = "npz",
+        dtype=np.float64,
+    ):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"fmt must be one of {self.FORMATS}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+
+        self.directory = Path(directory)
+        self.columns = tuple(columns)
+        self.chunk_size = chunk_size
+        self.fmt = fmt
+        self._buffer = np.empty((chunk_size, len(self.columns)), dtype=dtype)
+        self._n_rows = 0
+        self._n_shards = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, *values) -> None:
+        """Append one row; values are given in the order of ``columns``."""
+        self._buffer[self._n_rows] = values
+        self._n_rows += 1
+        if self._n_rows == self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows as a new shard and empty the buffer."""
+        if self._n_rows == 0:
+            return
+        rows = self._buffer[: self._n_rows]
+        path = self.directory / f"part-{self._n_shards:05d}.{self.fmt}"
+        # 途中で落ちても壊れたshardが残らないように，一時ファイルに書いてから置き換える
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            if self.fmt == "npz":
+                np.savez(f, **{col: rows[:, i] for i, col in enumerate(self.columns)})
+            else:
+                np.savetxt(
+                    f, rows, delimiter=",", header=",".join(self.columns), comments=""
+                )
+        os.replace(tmp_path, path)
+        self._n_shards += 1
+        self._n_rows = 0
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _exc_type, _exc_value, _traceback):
+        self.close()
+
+
+def read_metrics(directory: Union[str, Path]):
+    """Stitch the shards written by MetricsWriter back into a DataFrame."""
+    import pandas as pd
+
+    directory = Path(directory)
+    frames = []
+    for path in sorted(directory.glob("part-*")):
+        if path.suffix == ".npz":
+            with np.load(path) as shard:
+                frames.append(pd.DataFrame({col: shard[col] for col in shard.files}))
+        elif path.suffix == ".csv":
+            frames.append(pd.read_csv(path))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -1,11 +1,8 @@
 from itertools import product
 
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.colors import Normalize
-from matplotlib.cm import ScalarMappable
-from matplotlib.collections import PatchCollection
-from matplotlib.patches import Polygon, Rectangle
+
+# matplotlibは読み込みが重いため，描画時に初めてimportする
 
 
 def conv2state(env, agent_xy: tuple) -> int:
@@ -67,6 +64,12 @@ class QPlotter:
         cmap: matplotlib colormap name
         vmin, vmax: color scale limits
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import Normalize
+        from matplotlib.cm import ScalarMappable
+        from matplotlib.collections import PatchCollection
+        from matplotlib.patches import Polygon, Rectangle
+
         plt.ion()
         if self.fig is None:
             self.fig, self.ax = plt.subplots(figsize=(self.width, self.height))
@@ -137,5 +140,113 @@ class QPlotter:
         # plt.pause(0.01)
 
     def close(self):
+        import matplotlib.pyplot as plt
+
+        plt.close(self.fig)
+        plt.ioff()
+
+
+def _action_mask(cell_px: int) -> np.ndarray:
+    """(cell_px, cell_px) array of the action drawn at each pixel of a cell."""
+    center = (np.arange(cell_px) + 0.5) / cell_px - 0.5
+    dy, dx = np.meshgrid(center, center, indexing="ij")
+    vertical = np.abs(dy) >= np.abs(dx)
+    # 0: UP, 1: DOWN, 2: LEFT, 3: RIGHT（QPlotterの三角形と同じ向き．yは下向き）
+    return np.where(vertical, np.where(dy < 0, 0, 1), np.where(dx < 0, 2, 3))
+
+
+def q_table_image(
+    Q: np.ndarray,
+    width: int,
+    height: int,
+    cmap: str = "RdYlGn_r",
+    vmin: float = None,
+    vmax: float = None,
+    cell_px: int = 8,
+    gap_px: int = 2,
+) -> np.ndarray:
+    """
+    Render the whole Q table as one RGBA image of small multiples.
+    Q: array of shape (n_cells * n_cells, 4), state = agent_index * n_cells + target_index
+    The image has one panel per target cell (laid out like the grid), and each
+    panel shows every agent cell split into 4 triangles colored by Q[state, action].
+    """
+    from matplotlib import colormaps
+    from matplotlib.colors import Normalize
+
+    n_cells = width * height
+    if Q.shape != (n_cells * n_cells, 4):
+        raise ValueError(f"Q must have shape ({n_cells * n_cells}, 4)")
+
+    # (agent_y, agent_x, target_y, target_x, action) -> (target_y, agent_y, py, target_x, agent_x, px)
+    q = Q.reshape(height, width, height, width, 4)
+    mask = _action_mask(cell_px)
+    values = q[:, :, :, :, mask]  # (ay, ax, ty, tx, py, px)
+    values = values.transpose(2, 0, 4, 3, 1, 5)
+
+    norm = Normalize(
+        vmin=(Q.min() if vmin is None else vmin),
+        vmax=(Q.max() if vmax is None else vmax),
+    )
+    rgba = colormaps[cmap](norm(values), bytes=True)
+
+    # パネル間に隙間を入れ，目標セルを黒で塗る
+    panel_h, panel_w = height * cell_px, width * cell_px
+    image = np.full(
+        (height, panel_h + gap_px, width, panel_w + gap_px, 4), 255, dtype=np.uint8
+    )
+    image[:, :panel_h, :, :panel_w] = rgba.reshape(height, panel_h, width, panel_w, 4)
+    for ty, tx in np.ndindex(height, width):
+        image[
+            ty, ty * cell_px : (ty + 1) * cell_px, tx, tx * cell_px : (tx + 1) * cell_px
+        ] = (0, 0, 0, 255)
+    return image.reshape(height * (panel_h + gap_px), width * (panel_w + gap_px), 4)
+
+
+class QTablePlotter:
+    """
+    Visualize the whole Q table at once (see q_table_image).
+    Each refresh updates a single image, so it is cheap enough to call
+    every few thousand training steps.
+    """
+
+    def __init__(self, env, cell_px: int = 8, gap_px: int = 2):
+        self.width = env.grid_width
+        self.height = env.grid_height
+        if env.action_space.n != 4:
+            raise ValueError("QTablePlotter supports exactly 4 actions")
+        self.cell_px = cell_px
+        self.gap_px = gap_px
+        self.fig = None
+        self.image = None
+
+    def plot_q(
+        self,
+        Q: np.ndarray,
+        cmap: str = "RdYlGn_r",
+        vmin: float = None,
+        vmax: float = None,
+        title: str = "Q-table (panel: target cell, black: target)",
+    ):
+        import matplotlib.pyplot as plt
+
+        img = q_table_image(
+            Q, self.width, self.height, cmap, vmin, vmax, self.cell_px, self.gap_px
+        )
+        plt.ion()
+        if self.fig is None:
+            self.fig, self.ax = plt.subplots(figsize=(self.width * 2, self.height * 2))
+            self.image = self.ax.imshow(img, interpolation="nearest")
+            self.ax.set_axis_off()
+            self.fig.show()
+        else:
+            self.image.set_data(img)
+        self.ax.set_title(title)
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def close(self):
+        import matplotlib.pyplot as plt
+
         plt.close(self.fig)
         plt.ioff()
@@ -0,0 +1,234 @@
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+# ヘッダ（int64）: シーケンス番号，バージョン，学習ステップ，行数，列数，公開終了フラグ，
+#                  作成したプロセスのPID，作成完了フラグ（最後に書く）
+_HEADER_LEN = 8
+_SEQ, _VERSION, _STEP, _ROWS, _COLS, _CLOSED, _PID, _READY = range(_HEADER_LEN)
+Q_DTYPE = np.float32
+
+# このプロセスで作成した共有メモリの名前（resource_trackerの登録を消さないようにする）
+_created_names = set()
+
+
+class SharedQTable:
+    """
+    Q table in shared memory, published by one writer with a version stamp.
+    Writes are guarded by a sequence counter (odd while writing), so readers
+    in other processes copy out a consistent snapshot without a lock.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self._header = np.ndarray((_HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        shape = (int(self._header[_ROWS]), int(self._header[_COLS]))
+        self._q = np.ndarray(
+            shape, dtype=Q_DTYPE, buffer=shm.buf, offset=self._header.nbytes
+        )
+
+    @classmethod
+    def create(
+        cls, shape: Tuple[int, int], name: Optional[str] = None
+    ) -> "SharedQTable":
+        size = _HEADER_LEN * 8 + int(np.prod(shape)) * np.dtype(Q_DTYPE).itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((_HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_ROWS], header[_COLS] = shape
+        header[_PID] = os.getpid()
+        # 作成途中の共有メモリを開いた読み手が，大きさ0のQを読まないようにする
+        header[_READY] = 1
+        del header
+        _created_names.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, track: bool = True) -> "SharedQTable":
+        """
+        track: Falseにすると，このプロセスの終了時にresource_trackerが共有メモリを
+               削除しないようにする（作成元と無関係なプロセスから読むとき用）．
+               このプロセスで作成した共有メモリなら，作成側の登録をそのまま残す
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        if not track and os.name == "posix" and shm.name not in _created_names:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._q.shape
+
+    @property
+    def version(self) -> int:
+        return int(self._header[_VERSION])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._header[_CLOSED])
+
+    @property
+    def ready(self) -> bool:
+        """True once create() has finished the header and it matches this view."""
+        shape = (int(self._header[_ROWS]), int(self._header[_COLS]))
+        return (
+            bool(self._header[_READY]) and shape == self._q.shape and self._q.size > 0
+        )
+
+    @property
+    def owner_pid(self) -> int:
+        return int(self._header[_PID])
+
+    def publish(self, Q: np.ndarray, step: int = 0) -> int:
+        """Copy Q into shared memory as a new version. Returns the version."""
+        self._header[_SEQ] += 1
+        self._q[...] = Q
+        self._header[_VERSION] += 1
+        self._header[_STEP] = step
+        self._header[_SEQ] += 1
+        return int(self._header[_VERSION])
+
+    def read(
+        self, min_version: int = 0, retries: int = 1000
+    ) -> Optional[Tuple[int, int, np.ndarray]]:
+        """
+        Returns (version, step, copy of Q) if a version newer than min_version
+        has been published, otherwise None.
+        """
+        if not self.ready:
+            return None
+        for _ in range(retries):
+            seq = int(self._header[_SEQ])
+            if seq % 2 == 1:
+                # 書き込み中
+                time.sleep(0)
+                continue
+            version = int(self._header[_VERSION])
+            if version <= min_version:
+                return None
+            step = int(self._header[_STEP])
+            Q = self._q.copy()
+            if int(self._header[_SEQ]) == seq:
+                return version, step, Q
+        return None
+
+    def mark_closed(self) -> None:
+        """Tell readers that no more versions will be published."""
+        self._header[_CLOSED] = 1
+
+    def close(self) -> None:
+        del self._header, self._q
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            _created_names.discard(self._shm.name)
+
+    def unlink(self) -> None:
+        """Close and remove the shared memory even if this instance did not create it."""
+        self._owner = True
+        self.close()
+
+
+class QPublisher:
+    """
+    Publish Q snapshots of a running trainer under a fixed channel name, so
+    that an unrelated process (e.g. the OnlineEnv controller) can follow it.
+    """
+
+    def __init__(self, shape: Tuple[int, int], channel: str = "toio_rl_q"):
+        """
+        Raises FileExistsError if another running trainer publishes on `channel`.
+        A channel left behind by a trainer that has exited is reclaimed.
+        """
+        try:
+            self._shared = SharedQTable.create(shape, name=channel)
+        except FileExistsError:
+            existing = SharedQTable.attach(channel, track=False)
+            owner_pid = existing.owner_pid
+            existing.close()
+            if _process_alive(owner_pid):
+                raise FileExistsError(
+                    f"channel '{channel}' is used by a running trainer (pid {owner_pid})"
+                ) from None
+            # 異常終了した学習が残した共有メモリを作り直す
+            SharedQTable.attach(channel).unlink()
+            self._shared = SharedQTable.create(shape, name=channel)
+
+    @property
+    def channel(self) -> str:
+        return self._shared.name
+
+    def publish(self, Q: np.ndarray, step: int = 0) -> int:
+        return self._shared.publish(Q, step)
+
+    def close(self) -> None:
+        self._shared.mark_closed()
+        self._shared.close()
+
+
+class QSubscriber:
+    """
+    Follow the Q snapshots of a QPublisher from another process.
+    poll() never blocks: it returns a consistent copy of a version newer than
+    the last one returned, or None (stale or repeated versions are rejected).
+    The channel is attached lazily and re-attached when the publisher closes,
+    so the trainer may be started, stopped and restarted at any time.
+    """
+
+    def __init__(self, channel: str = "toio_rl_q"):
+        self.channel = channel
+        self.version = 0
+        self._shared: Optional[SharedQTable] = None
+
+    def poll(self) -> Optional[Tuple[int, int, np.ndarray]]:
+        """Returns (version, training step, Q) or None."""
+        if self._shared is None:
+            try:
+                self._shared = SharedQTable.attach(self.channel, track=False)
+            except (FileNotFoundError, ValueError):
+                # ValueError: 作成直後で大きさがまだ0の共有メモリ
+                return None
+        if not self._shared.ready:
+            # 作成途中に開いたため，Qの形が読めていない．次のpollで開き直す
+            self.close()
+            return None
+        closed = self._shared.closed
+        snapshot = self._shared.read(min_version=self.version)
+        if snapshot is not None:
+            self.version = snapshot[0]
+        elif closed:
+            # 学習側が終了した（最後のバージョンは受け取り済み）．
+            # 次の学習は新しい共有メモリでバージョン1から始まる
+            self.close()
+            self.version = 0
+        return snapshot
+
+    def close(self) -> None:
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name != "posix":
+        # Windowsの共有メモリは最後のハンドルが閉じると消えるため，残っていれば使用中とみなす
+        # （os.kill(pid, 0)はWindowsではプロセスを終了させてしまう）
+        return True
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 他のユーザーのプロセスとして存在する
+        return True
+    return True
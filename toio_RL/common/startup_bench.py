@@ -0,0 +1,67 @@
+import argparse
+import subprocess
+import sys
+from typing import Dict, Sequence, Tuple
+
+# オフライン学習・スイープのワーカーが読み込むモジュール
+DEFAULT_MODULES = (
+    "toio_RL.d1_workshop1113.offline_env",
+    "toio_RL.d1_workshop1113.q_learning",
+)
+# 上記の読み込み時にimportされてはいけない重い依存
+FORBIDDEN_MODULES = ("matplotlib", "pandas", "readchar", "toio", "bleak")
+# 上記モジュールのimport時間の上限 [ms]
+DEFAULT_BUDGET_MS = 300.0
+
+
+def measure_import(module: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Import a module in a fresh interpreter with `python -X importtime`.
+    Returns the cumulative import time of the module [ms] and
+    the cumulative time of every module imported on the way [ms].
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time: self [us] | cumulative [us] | module"
+        _, cumulative_us, name = line.split("|")
+        times[name.strip()] = int(cumulative_us) / 1000
+    return times[module], times
+
+
+def check_startup(
+    modules: Sequence[str] = DEFAULT_MODULES,
+    budget_ms: float = DEFAULT_BUDGET_MS,
+    forbidden: Sequence[str] = FORBIDDEN_MODULES,
+    top: int = 5,
+) -> bool:
+    ok = True
+    for module in modules:
+        total_ms, times = measure_import(module)
+        loaded = [
+            name for name in forbidden if any(m.split(".")[0] == name for m in times)
+        ]
+        status = "OK" if total_ms <= budget_ms and not loaded else "NG"
+        print(f"[{status}] {module}: {total_ms:.1f} ms (budget {budget_ms:.1f} ms)")
+        for name, ms in sorted(times.items(), key=lambda kv: -kv[1])[1 : top + 1]:
+            print(f"    {ms:8.1f} ms  {name}")
+        if loaded:
+            print(f"    heavy dependencies imported: {', '.join(loaded)}")
+        ok = ok and status == "OK"
+    return ok
+
+
+if __name__ == "__main__":
+    # 使い方: python -m toio_RL.common.startup_bench --budget-ms 300
+    parser = argparse.ArgumentParser(description="Check import latency of modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+    sys.exit(0 if check_startup(args.modules, args.budget_ms) else 1)
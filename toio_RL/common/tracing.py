@@ -0,0 +1,210 @@
+import functools
+import inspect
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 1イベントのレコード．a, b, cとvalueの意味はプローブごとに決める
+EVENT_DTYPE = np.dtype(
+    [
+        ("t", "f8"),
+        ("duration", "f4"),
+        ("probe", "u1"),
+        ("a", "i4"),
+        ("b", "i4"),
+        ("c", "i4"),
+        ("value", "f4"),
+    ]
+)
+
+# fields(戻り値, self, メソッドの引数...) -> (a, b, c, value)
+# 引数名はメソッドと同じにする（キーワード引数で呼ばれても同じように受け取れる）
+Fields = Callable[..., Tuple[int, int, int, float]]
+
+
+class Tracer:
+    """
+    Structured tracing of hot-path methods into a preallocated ring buffer.
+    Probes are registered per (class, method) but the methods are only
+    replaced by recording wrappers between enable() and disable(), so a
+    disabled tracer leaves the original methods untouched and costs nothing.
+    Since the class is patched, calls on every instance are recorded unless
+    enable() is given the instances to trace.
+    When the buffer is full the oldest events are overwritten.
+    """
+
+    def __init__(self, capacity: int = 10**6):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self._count = 0
+        self._probes: List[Tuple[type, str, Fields]] = []
+        # (クラス, メソッド名) -> (元のメソッド, そのクラス自身で定義されていたか)
+        self._originals: Dict[Tuple[type, str], Tuple[Callable, bool]] = {}
+        self._instance_ids: Optional[set] = None
+
+    @property
+    def names(self) -> List[str]:
+        return [f"{cls.__name__}.{name}" for cls, name, _ in self._probes]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._originals)
+
+    def probe(self, cls: type, name: str, fields: Fields) -> None:
+        """
+        Register cls.name. fields is called as fields(result, self, *args, **kwargs)
+        and returns (a, b, c, value); its parameters after `result` must have
+        the same names as those of the method. Inherited methods can be probed;
+        only calls dispatched through cls (and its subclasses) are recorded.
+        """
+        if self.enabled:
+            raise RuntimeError("cannot add probes while tracing is enabled")
+        method_params = list(inspect.signature(_resolve(cls, name)).parameters)
+        field_params = list(inspect.signature(fields).parameters)[1:]
+        if field_params != method_params:
+            raise TypeError(
+                f"fields for {cls.__name__}.{name} must take (result, "
+                f"{', '.join(method_params)}), got ({', '.join(field_params)})"
+            )
+        self._probes.append((cls, name, fields))
+
+    def enable(self, instances: Optional[Iterable] = None) -> None:
+        """instances: 記録する対象のインスタンス（Noneなら全てのインスタンス）"""
+        if self.enabled:
+            return
+        self._instance_ids = (
+            None if instances is None else {id(obj) for obj in instances}
+        )
+        # 親クラスのメソッドを先に差し替えると，子クラスで二重に記録されるため，先に全て解決しておく
+        originals = [
+            (_resolve(cls, name), name in cls.__dict__) for cls, name, _ in self._probes
+        ]
+        for probe_id, ((cls, name, fields), (original, own)) in enumerate(
+            zip(self._probes, originals)
+        ):
+            self._originals[(cls, name)] = (original, own)
+            setattr(cls, name, self._wrap(probe_id, original, fields))
+
+    def disable(self) -> None:
+        for (cls, name), (original, own) in self._originals.items():
+            if own:
+                setattr(cls, name, original)
+            else:
+                # 継承していたメソッドは，親クラスの定義が再び見えるように消す
+                delattr(cls, name)
+        self._originals.clear()
+
+    def __enter__(self) -> "Tracer":
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.disable()
+
+    def events(self) -> np.ndarray:
+        """Recorded events in chronological order (at most `capacity` of them)."""
+        if self._count <= self.capacity:
+            return self._buffer[: self._count].copy()
+        head = self._count % self.capacity
+        return np.concatenate((self._buffer[head:], self._buffer[:head]))
+
+    def clear(self) -> None:
+        self._count = 0
+
+    def dump(self, path) -> None:
+        np.savez(
+            path,
+            events=self.events(),
+            names=np.array(self.names),
+            dropped=max(self._count - self.capacity, 0),
+        )
+
+    # ----- private methods -----
+
+    def _wrap(self, probe_id: int, func: Callable, fields: Fields) -> Callable:
+        buffer = self._buffer
+        capacity = self.capacity
+        perf_counter = time.perf_counter
+        instance_ids = self._instance_ids
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if instance_ids is not None and id(args[0]) not in instance_ids:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            result = func(*args, **kwargs)
+            end = perf_counter()
+            buffer[self._count % capacity] = (
+                start,
+                end - start,
+                probe_id,
+                *fields(result, *args, **kwargs),
+            )
+            self._count += 1
+            return result
+
+        return wrapper
+
+
+def _resolve(cls: type, name: str) -> Callable:
+    """The function cls.name refers to, looked up through the MRO without binding."""
+    try:
+        return inspect.getattr_static(cls, name)
+    except AttributeError:
+        raise AttributeError(
+            f"cannot probe {cls.__name__}.{name}: no such method"
+        ) from None
+
+
+def load_trace(path) -> Tuple[np.ndarray, List[str], int]:
+    """Returns (events, probe names, number of dropped events)."""
+    with np.load(path) as data:
+        return data["events"], list(data["names"]), int(data["dropped"])
+
+
+def summarize(events: np.ndarray, names: List[str]) -> List[Dict[str, float]]:
+    """Call count, timing [us] and mean value per probe."""
+    rows = []
+    for probe_id, name in enumerate(names):
+        selected = events[events["probe"] == probe_id]
+        if len(selected) == 0:
+            continue
+        duration_us = selected["duration"].astype(np.float64) * 1e6
+        rows.append(
+            {
+                "probe": name,
+                "calls": len(selected),
+                "total_ms": duration_us.sum() / 1e3,
+                "mean_us": duration_us.mean(),
+                "p50_us": np.percentile(duration_us, 50),
+                "p99_us": np.percentile(duration_us, 99),
+                "max_us": duration_us.max(),
+                "mean_value": float(selected["value"].mean()),
+            }
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    """
+    書き出したトレースを集計する
+    python -m toio_RL.common.tracing log/trace_xxx.npz
+    """
+    import sys
+
+    path = Path(sys.argv[1])
+    events, names, dropped = load_trace(path)
+    span = events["t"][-1] - events["t"][0] if len(events) else 0.0
+    print(f"{path}: {len(events)} events over {span:.3f} s ({dropped} dropped)")
+    print(
+        f"{'probe':<32} {'calls':>9} {'total[ms]':>10} {'mean[us]':>9} "
+        f"{'p50[us]':>8} {'p99[us]':>8} {'max[us]':>9} {'mean value':>11}"
+    )
+    for row in summarize(events, names):
+        print(
+            f"{row['probe']:<32} {row['calls']:>9} {row['total_ms']:>10.1f} "
+            f"{row['mean_us']:>9.2f} {row['p50_us']:>8.2f} {row['p99_us']:>8.2f} "
+            f"{row['max_us']:>9.1f} {row['mean_value']:>11.4g}"
+        )
@@ -0,0 +1,98 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLearner:
+    """
+    Run QTableAgent updates in a background thread while the cube is moving.
+    The worker thread is the only writer of agent.Q. After each update it
+    publishes a copy of the table, and action selection reads only that
+    snapshot, so the asyncio control loop never waits for learning.
+    """
+
+    def __init__(
+        self,
+        agent,
+        planning_steps: int = 0,
+        replay_size: int = 10**4,
+        seed: Optional[int] = None,
+    ):
+        """
+        agent: QTableAgent. 以降，agent.Qはワーカースレッドだけが更新する
+        planning_steps: 1回の実遷移ごとに，過去の遷移から追加で行う更新の回数
+        replay_size: 保持する過去の遷移の最大数
+        """
+        self.agent = agent
+        self.planning_steps = planning_steps
+        self.replay_size = replay_size
+        self._replay: List[Tuple[int, int, float, int, bool]] = []
+        self._replay_pos = 0
+        # 行動選択用の乱数はasyncio側，リプレイ用の乱数はワーカー側で別々に持つ
+        self._rng = np.random.default_rng(seed)
+        self._replay_rng = np.random.default_rng(None if seed is None else seed + 1)
+        self._snapshot = agent.Q.copy()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._error: Optional[BaseException] = None
+        self.num_updates = 0
+
+    @property
+    def Q(self) -> np.ndarray:
+        """Latest published Q snapshot (read-only view for plotting)."""
+        return self._snapshot
+
+    def select_action(self, state, greedy: bool = False) -> int:
+        q_row = self._snapshot[state]
+        if not greedy and self._rng.random() < self.agent.epsilon:
+            return int(self._rng.integers(len(q_row)))
+        candidates = np.flatnonzero(q_row == q_row.max())
+        return int(self._rng.choice(candidates))
+
+    def greedy(self, state) -> int:
+        return self.select_action(state, greedy=True)
+
+    def submit(self, state, action, reward, next_state, done) -> None:
+        """Queue one transition for learning without blocking the caller."""
+        self._raise_if_failed()
+        self._executor.submit(self._learn, (state, action, reward, next_state, done))
+
+    def close(self) -> np.ndarray:
+        """Wait for queued updates and return the final Q table."""
+        self._executor.shutdown(wait=True)
+        self._raise_if_failed()
+        return self.agent.Q
+
+    # ----- private methods -----
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("background update failed") from self._error
+
+    def _learn(self, transition) -> None:
+        try:
+            self._update(transition)
+        except BaseException as e:
+            self._error = e
+            raise
+
+    def _update(self, transition) -> None:
+        self.agent.update(*transition)
+        self._store(transition)
+        for _ in range(min(self.planning_steps, len(self._replay))):
+            idx = self._replay_rng.integers(len(self._replay))
+            self.agent.update(*self._replay[idx])
+        self.num_updates += 1
+        # 参照の置き換えは原子的なので，行動選択側は常に一貫したQを読む
+        self._snapshot = self.agent.Q.copy()
+        logger.debug("published Q snapshot %d", self.num_updates)
+
+    def _store(self, transition) -> None:
+        if len(self._replay) < self.replay_size:
+            self._replay.append(transition)
+        else:
+            self._replay[self._replay_pos] = transition
+            self._replay_pos = (self._replay_pos + 1) % self.replay_size
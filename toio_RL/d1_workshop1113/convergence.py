@@ -0,0 +1,105 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ConvergenceMonitor:
+    """
+    Decide when train() can stop early.
+    Every `window` steps the Q table is compared with the previous window:
+    training is considered converged when the relative Q-delta norm (RMS of
+    ΔQ over all entries divided by max|Q|, so it does not depend on
+    goal_reward) stays below q_tol and at most max_policy_flips states change
+    their greedy action for `patience` windows in a row.
+    With a constant alpha and random respawns Q never stops moving, so q_tol
+    is a noise floor rather than an exact fixed point.
+    Optionally, training also stops when the eval reward has not improved by
+    more than eval_min_delta for `eval_patience` evaluations.
+    """
+
+    def __init__(
+        self,
+        window: int = 10**4,
+        q_tol: float = 0.02,
+        patience: int = 3,
+        max_policy_flips: int = 2,
+        eval_patience: Optional[int] = None,
+        eval_min_delta: float = 0.0,
+        min_steps: int = 0,
+    ):
+        """
+        window: Qの変化を調べる間隔（step）
+        q_tol: 収束とみなすQの相対変化量（ΔQの二乗平均平方根 / max|Q|）の上限
+        patience: 収束とみなすために必要な，連続して条件を満たしたwindowの数
+        max_policy_flips: 収束とみなす，1windowで貪欲行動が変わった状態数の上限
+                          （Q値がほぼ同じ行動の間では入れ替わり続けるため，0にすると止まりにくい）
+        eval_patience: 評価報酬が改善しなかったら止める評価回数（Noneなら使わない）
+        eval_min_delta: 改善とみなす評価報酬の増加量
+        min_steps: この学習ステップ数までは止めない
+        """
+        self.window = window
+        self.q_tol = q_tol
+        self.patience = patience
+        self.max_policy_flips = max_policy_flips
+        self.eval_patience = eval_patience
+        self.eval_min_delta = eval_min_delta
+        self.min_steps = min_steps
+
+        self.stop_reason: Optional[str] = None
+        self.stop_step: Optional[int] = None
+        self.history: List[Dict[str, float]] = []
+        self._prev_Q: Optional[np.ndarray] = None
+        self._prev_greedy: Optional[np.ndarray] = None
+        self._stable_windows = 0
+        self._best_eval = -np.inf
+        self._evals_since_best = 0
+
+    def check_q(self, step: int, Q: np.ndarray) -> bool:
+        """Call every `window` steps. Returns True when training should stop."""
+        greedy = Q.argmax(axis=1)
+        if self._prev_Q is None:
+            self._prev_Q = Q.copy()
+            self._prev_greedy = greedy
+            return False
+        scale = max(float(np.max(np.abs(Q))), np.finfo(np.float32).tiny)
+        q_delta = float(np.sqrt(np.mean(np.square(Q - self._prev_Q)))) / scale
+        policy_flips = int(np.count_nonzero(greedy != self._prev_greedy))
+        self._prev_Q[...] = Q
+        self._prev_greedy = greedy
+        self.history.append(
+            {"step": step, "q_delta": q_delta, "policy_flips": policy_flips}
+        )
+        logger.info(f"{step=}, {q_delta=:.3g}, {policy_flips=}")
+
+        if q_delta < self.q_tol and policy_flips <= self.max_policy_flips:
+            self._stable_windows += 1
+        else:
+            self._stable_windows = 0
+        if self._stable_windows >= self.patience:
+            return self._stop(step, "q_converged")
+        return False
+
+    def check_eval(self, step: int, eval_reward: float) -> bool:
+        """Call after each evaluation. Returns True when training should stop."""
+        if self.eval_patience is None:
+            return False
+        if eval_reward > self._best_eval + self.eval_min_delta:
+            self._best_eval = eval_reward
+            self._evals_since_best = 0
+            return False
+        self._evals_since_best += 1
+        if self._evals_since_best >= self.eval_patience:
+            return self._stop(step, "eval_plateau")
+        return False
+
+    # ----- private methods -----
+
+    def _stop(self, step: int, reason: str) -> bool:
+        if step < self.min_steps:
+            return False
+        self.stop_reason = reason
+        self.stop_step = step
+        return True
@@ -1,7 +1,9 @@
 import asyncio
 
+from background_learner import BackgroundLearner
 from online_env import OnlineEnv
 from q_learning import QTableAgent
+from transition_recorder import TransitionRecorder
 from toio_RL.common.q_plotter import QPlotter
 
 
@@ -33,6 +35,42 @@ async def test_agent(
         await env.close()
 
 
+async def train_agent(env, learner, q_file_name=None, recorder=None):
+    """
+    toioを動かしながら学習する．Qの更新はlearnerのワーカースレッドで行い，
+    行動選択は公開済みのQのスナップショットから行う
+    """
+    q_plotter = QPlotter(env)
+
+    try:
+        state, _ = await env.reset()
+        env.render()
+        q_plotter.plot_q(Q=learner.Q)
+
+        for step in range(10000):
+            print(f"\n--- ステップ {step + 1} ---")
+            action = learner.select_action(state)
+            next_state, reward, _, _, info = await env.step(action)
+            if recorder is not None:
+                recorder.record(state, action, reward, next_state, info)
+            # toioの移動中にQを更新できるよう，更新はワーカーに投げるだけ
+            learner.submit(state, action, reward, next_state, False)
+            state = next_state
+            env.render()
+            q_plotter.plot_q(Q=learner.Q)
+            print(f"状態:{state}, 報酬:{reward}, 更新回数:{learner.num_updates}")
+            await asyncio.sleep(1.0)  # 可視化が遅れるので必須
+    except KeyboardInterrupt:
+        print("\nCtrl+C を受け取りました。終了します。")
+    finally:
+        learner.close()
+        if recorder is not None:
+            recorder.close()
+        if q_file_name is not None:
+            learner.agent.save_q(q_file_name)
+        await env.close()
+
+
 if __name__ == "__main__":
     """
     TODO 学習前の状態の観察
@@ -50,10 +88,26 @@ if __name__ == "__main__":
     6. 目標toioをマットに置く
     7. Q値のplotが表示されている（全て0，ランダムに動く）
     8. ctrl+cで停止
+
+    ONLINE_LEARNING = Trueにすると，toioを動かしながら学習する（Q値が徐々に更新される）
     """
+    # toioを動かしながら学習するか
+    ONLINE_LEARNING = False
+    # 1回の実遷移ごとに，過去の遷移から追加で行う更新の回数
+    PLANNING_STEPS = 100
+    # 実機での遷移を書き出すファイル名（不要ならNone）
+    RECORD_FILE_NAME = "transitions.trl"
+
     env = OnlineEnv(agent_name="toio-n2r", target_name="toio-22N")
     agent = QTableAgent(
         env.observation_space,
         env.action_space,
     )
-    asyncio.run(test_agent(env, agent, q_plot_interval=1))
+    if ONLINE_LEARNING:
+        learner = BackgroundLearner(agent, planning_steps=PLANNING_STEPS)
+        recorder = TransitionRecorder(RECORD_FILE_NAME) if RECORD_FILE_NAME else None
+        asyncio.run(
+            train_agent(env, learner, q_file_name="q_online", recorder=recorder)
+        )
+    else:
+        asyncio.run(test_agent(env, agent, q_plot_interval=1))
@@ -5,12 +5,17 @@ from datetime import datetime
 import json
 import os
 
-import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 
 from q_learning import QTableAgent
 from offline_env import OfflineEnv
-from toio_RL.common.q_plotter import QPlotter
+from convergence import ConvergenceMonitor
+from eval_worker import AsyncEvaluator
+from markov_eval import GridMarkovModel
+from trace_points import make_tracer
+from toio_RL.common.q_plotter import QPlotter, QTablePlotter
+from toio_RL.common.metrics_writer import MetricsWriter
+from toio_RL.common.shared_q import QPublisher
 
 
 def train(
@@ -24,47 +29,129 @@ def train(
     plot_q: bool = True,
     plot_interval=10**2,
     plot_steps=20,
+    eval_metrics: Optional[MetricsWriter] = None,
+    step_metrics: Optional[MetricsWriter] = None,
+    monitor: Optional[ConvergenceMonitor] = None,
+    evaluator: Optional[AsyncEvaluator] = None,
+    plot_table_interval: Optional[int] = None,
+    exact_eval: Optional[GridMarkovModel] = None,
+    q_publisher: Optional[QPublisher] = None,
+    publish_interval: int = 10**3,
 ):
+    """
+    eval_metrics: 評価ごとに (step, eval_rewards, elapse_time, q_norm) を書き出す
+    step_metrics: 学習ステップごとに (step, reward, td_error) を書き出す
+    monitor: 収束を判定して学習を打ち切る．打ち切った理由はmonitor.stop_reasonに残る
+    evaluator: 指定すると，評価を別プロセスで非同期に行う（eval_env, eval_stepsは使わない）
+    plot_table_interval: 指定すると，この間隔（step）でQテーブル全体を1枚の画像で表示する
+    exact_eval: 指定すると，ロールアウトの代わりにマルコフ連鎖から評価報酬の期待値を厳密に計算する
+    q_publisher: 指定すると，publish_interval（step）ごとと学習の最後にQを公開する（demo3が実行中に読み込む）
+    """
     start_timestamp = time.time()
     eval_rewards = []
     elapse_time = []
     steps = []
 
+    def record_eval(step, eval_reward_sum, finished_at, q_norm) -> bool:
+        """評価結果を記録する．学習を打ち切るときはTrueを返す"""
+        print(f"Evaluation: {step=}, {eval_reward_sum=}")
+        eval_rewards.append(eval_reward_sum)
+        elapse_time.append(finished_at - start_timestamp)
+        steps.append(step)
+        if eval_metrics is not None:
+            eval_metrics.append(step, eval_reward_sum, elapse_time[-1], q_norm)
+        return monitor is not None and monitor.check_eval(step, eval_reward_sum)
+
     state, _ = env.reset()
     if plot_q:
         q_plotter = QPlotter(eval_env)
         q_plotter.plot_q(Q=agent.Q)
+    if plot_table_interval is not None:
+        q_table_plotter = QTablePlotter(eval_env)
+
+    # 学習したステップ数（num_steps == 0ならループに入らない）
+    step = 0
+    try:
+        for step in range(1, num_steps + 1):
+            action = agent.select_action(state)
+            next_state, reward, _, _, _ = env.step(action)
+
+            td_error = agent.update(state, action, reward, next_state, False)
+            state = next_state
+            if step_metrics is not None:
+                step_metrics.append(step, reward, td_error)
+            if (
+                monitor is not None
+                and step % monitor.window == 0
+                and monitor.check_q(step, agent.Q)
+            ):
+                break
+
+            if q_publisher is not None and step % publish_interval == 0:
+                q_publisher.publish(agent.Q, step)
+            if plot_table_interval is not None and step % plot_table_interval == 0:
+                q_table_plotter.plot_q(Q=agent.Q, title=f"Q-table ({step=})")
 
-    for step in range(1, num_steps + 1):
-        action = agent.select_action(state)
-        next_state, reward, _, _, _ = env.step(action)
-
-        agent.update(state, action, reward, next_state, False)
-        state = next_state
-
-        if (step % eval_interval == 0) or (plot_q and step % plot_interval == 0):
-            eval_reward_sum = 0
-            _eval_step = 0
-            eval_state, _ = eval_env.reset()
-            while _eval_step < eval_steps:
-                action = agent.greedy(eval_state)
-                next_state, reward, _, _, _ = eval_env.step(action)
-                eval_state = next_state
-                eval_reward_sum += reward
-                _eval_step += 1
-                if plot_q and step % plot_interval == 0 and _eval_step < plot_steps:
-                    q_plotter.plot_q(Q=agent.Q)
-                    print(f"{step=}, {_eval_step=}")
-
-            print(f"Evaluation: {step=}, {eval_reward_sum=}")
-            eval_rewards.append(eval_reward_sum)
-            elapse_time.append(time.time() - start_timestamp)
-            steps.append(step)
+            is_eval = step % eval_interval == 0
+            is_plot = plot_q and step % plot_interval == 0
+            if evaluator is not None and is_eval:
+                # 評価は別プロセスに任せ，届いた結果だけを記録する
+                evaluator.submit(agent.Q, step)
+                if any(record_eval(*result) for result in evaluator.poll()):
+                    break
+                is_eval = False
+            if exact_eval is not None and is_eval:
+                # eval_stepsステップの獲得報酬の期待値（乱数によるばらつきがない）
+                chain = exact_eval.greedy_chain(agent.Q)
+                eval_reward_sum = chain.finite_horizon_reward(eval_steps)
+                if record_eval(
+                    step, eval_reward_sum, time.time(), np.linalg.norm(agent.Q)
+                ):
+                    break
+                is_eval = False
+
+            if is_eval or is_plot:
+                eval_reward_sum = 0
+                _eval_step = 0
+                eval_state, _ = eval_env.reset()
+                while _eval_step < eval_steps:
+                    action = agent.greedy(eval_state)
+                    next_state, reward, _, _, _ = eval_env.step(action)
+                    eval_state = next_state
+                    eval_reward_sum += reward
+                    _eval_step += 1
+                    if is_plot and _eval_step < plot_steps:
+                        q_plotter.plot_q(Q=agent.Q)
+                        print(f"{step=}, {_eval_step=}")
+
+                if (
+                    (evaluator is None and exact_eval is None) or is_eval
+                ) and record_eval(
+                    step, eval_reward_sum, time.time(), np.linalg.norm(agent.Q)
+                ):
+                    break
+
+        if q_publisher is not None and step > 0:
+            q_publisher.publish(agent.Q, step)
+        if evaluator is not None:
+            for result in evaluator.close():
+                record_eval(*result)
+    finally:
+        # Ctrl+Cで止めても，それまでの評価結果・学習ステップの記録が残るように書き出す
+        if eval_metrics is not None:
+            eval_metrics.flush()
+        if step_metrics is not None:
+            step_metrics.flush()
+
+    if monitor is not None and monitor.stop_reason is not None:
+        print(f"Early stopping: step={monitor.stop_step}, {monitor.stop_reason=}")
 
     if log_q is not None:
         agent.save_q(log_q)
     if plot_q:
         q_plotter.close()
+    if plot_table_interval is not None:
+        q_table_plotter.close()
     return eval_rewards, elapse_time, steps
 
 
@@ -83,6 +170,9 @@ if __name__ == "__main__":
     4. 学習中に4回，20stepの間だけQ値が表示される（toioの挙動が変わる）
     5. 最後に学習曲線が表示される（横軸は学習ステップ，縦軸は100stepの間に目標に到達した回数✕報酬に一致）
     """
+    # 書き出し・可視化にしか使わないため，train()を読み込むだけのときはimportしない
+    import matplotlib.pyplot as plt
+    import pandas as pd
 
     # パラメータ
     # 探索率．0から1の実数（推奨0.1）
@@ -113,12 +203,69 @@ if __name__ == "__main__":
     PLOT_INTERVAL = NUM_STEPS / 4
     # Q値を可視化するステップ数．各intervalごとに，表示しているステップの数
     PLOT_STEPS = 20
+    # 学習ステップごとの報酬・TD誤差を書き出すか（学習中に逐次書き出されるため，途中で止めても残る）
+    LOG_STEP_METRICS = False
+    # 収束したら学習を打ち切るか．CONVERGENCE_WINDOWステップごとにQの変化と貪欲方策の変化を調べる
+    EARLY_STOPPING = False
+    CONVERGENCE_WINDOW = 10**4
+    # 収束とみなすQの相対変化量（windowごとのΔQの二乗平均平方根 / max|Q|．GOAL_REWARDによらない）
+    Q_TOL = 0.02
+    # 評価報酬がこの回数だけ改善しなければ打ち切る（Noneなら評価報酬では打ち切らない）
+    EVAL_PATIENCE = None
+    # 評価を別プロセスで行うか（学習の速度が評価の重さに左右されなくなる．DISPLAY_Qの表示は学習側で行う）
+    ASYNC_EVAL = False
+    # Qテーブル全体（全ての目標位置）を1枚で表示する間隔（step）．Noneなら表示しない
+    PLOT_TABLE_INTERVAL = None
+    # 評価報酬をロールアウトではなくマルコフ連鎖で厳密に計算するか（ASYNC_EVALと同時には使わない）
+    EXACT_EVAL = False
+    # 学習中の関数呼び出し（update, select_action, step, _respawn_target）を記録するか
+    # 記録はlog/trace_<日時>.npzに書き出され，python -m toio_RL.common.tracing <ファイル> で集計できる
+    TRACE = False
+    # 学習中のQをQ_CHANNELに公開するか．demo3_adapt.pyのSUBSCRIBE_Qと合わせて使うと，実機の方策が学習中に更新される
+    PUBLISH_Q = False
+    Q_CHANNEL = "toio_rl_q"
+    PUBLISH_INTERVAL = 10**3
 
     env = OfflineEnv(life_range=target_life_range_for_learn, goal_reward=GOAL_REWARD)
     eval_env = OfflineEnv(
         life_range=target_life_range_for_eval, goal_reward=GOAL_REWARD
     )
 
+    os.makedirs(Path("log"), exist_ok=True)
+    time_str = datetime.now().strftime("%Y_%m%d_%H%M%S")
+    monitor = (
+        ConvergenceMonitor(
+            window=CONVERGENCE_WINDOW, q_tol=Q_TOL, eval_patience=EVAL_PATIENCE
+        )
+        if EARLY_STOPPING
+        else None
+    )
+    evaluator = (
+        AsyncEvaluator(
+            (env.observation_space.n, env.action_space.n),
+            env_kwargs={
+                "life_range": target_life_range_for_eval,
+                "goal_reward": GOAL_REWARD,
+            },
+            eval_steps=EVAL_STEPS,
+        )
+        if ASYNC_EVAL
+        else None
+    )
+    eval_metrics = MetricsWriter(
+        Path("log") / f"eval_{time_str}",
+        columns=("step", "eval_rewards", "elapse_time", "q_norm"),
+        # 評価は10回程度なので，1回ごとに書き出す（途中で止めても残る）
+        chunk_size=1,
+    )
+    step_metrics = (
+        MetricsWriter(
+            Path("log") / f"step_{time_str}", columns=("step", "reward", "td_error")
+        )
+        if LOG_STEP_METRICS
+        else None
+    )
+
     agent = QTableAgent(
         env.observation_space,
         env.action_space,
@@ -127,6 +274,15 @@ if __name__ == "__main__":
         epsilon=EPSILON,
     )
 
+    q_publisher = (
+        QPublisher((env.observation_space.n, env.action_space.n), channel=Q_CHANNEL)
+        if PUBLISH_Q
+        else None
+    )
+    tracer = make_tracer() if TRACE else None
+    if tracer is not None:
+        # 評価用のeval_envやロールアウトは記録しない
+        tracer.enable(instances=(agent, env))
     eval_rewards, elapse_time, steps = train(
         env,
         eval_env=eval_env,
@@ -138,11 +294,23 @@ if __name__ == "__main__":
         plot_interval=PLOT_INTERVAL,
         plot_steps=PLOT_STEPS,
         plot_q=DISPLAY_Q,
+        eval_metrics=eval_metrics,
+        step_metrics=step_metrics,
+        monitor=monitor,
+        evaluator=evaluator,
+        plot_table_interval=PLOT_TABLE_INTERVAL,
+        exact_eval=GridMarkovModel.from_env(eval_env) if EXACT_EVAL else None,
+        q_publisher=q_publisher,
+        publish_interval=PUBLISH_INTERVAL,
     )
+    if q_publisher is not None:
+        q_publisher.close()
+
+    if tracer is not None:
+        tracer.disable()
+        tracer.dump(Path("log") / f"trace_{time_str}.npz")
 
     # 動作確認向けログ
-    os.makedirs(Path("log"), exist_ok=True)
-    time_str = datetime.now().strftime("%Y_%m%d_%H%M%S")
     agent.save_q(Path("log") / f"q_{time_str}")
 
     # csvファイルに書き出す
@@ -163,6 +331,21 @@ if __name__ == "__main__":
         "EVAL_STEPS": EVAL_STEPS,
         "PLOT_INTERVAL": PLOT_INTERVAL,
         "PLOT_STEPS": PLOT_STEPS,
+        "LOG_STEP_METRICS": LOG_STEP_METRICS,
+        "EARLY_STOPPING": EARLY_STOPPING,
+        "CONVERGENCE_WINDOW": CONVERGENCE_WINDOW,
+        "Q_TOL": Q_TOL,
+        "EVAL_PATIENCE": EVAL_PATIENCE,
+        "ASYNC_EVAL": ASYNC_EVAL,
+        "PLOT_TABLE_INTERVAL": PLOT_TABLE_INTERVAL,
+        "EXACT_EVAL": EXACT_EVAL,
+        "TRACE": TRACE,
+        "PUBLISH_Q": PUBLISH_Q,
+        "Q_CHANNEL": Q_CHANNEL,
+        "PUBLISH_INTERVAL": PUBLISH_INTERVAL,
+        # 学習を打ち切った理由とステップ（最後まで学習した場合はNone）
+        "STOP_REASON": monitor.stop_reason if monitor is not None else None,
+        "STOP_STEP": monitor.stop_step if monitor is not None else None,
     }
     with open(Path("log") / f"param_{time_str}.json", "w", encoding="utf-8") as f:
         json.dump(params, f, ensure_ascii=False, indent=2)
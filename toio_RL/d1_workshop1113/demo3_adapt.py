@@ -1,11 +1,36 @@
 import asyncio
 
+import numpy as np
+
 from online_env import OnlineEnv
-from q_learning import QTableAgent
+from policy_table import PolicyTable
+from transition_recorder import TransitionRecorder
 from toio_RL.common.q_plotter import QPlotter
+from toio_RL.common.shared_q import QSubscriber
+
 
+def swap_q(agent, Q: np.ndarray) -> None:
+    """Replace the table used by agent.greedy (QTableAgent or PolicyTable)."""
+    if isinstance(agent, PolicyTable):
+        agent.set_q(Q)
+    else:
+        agent.Q = Q
 
-async def test_agent(env, agent, q_plot_interval, q_plot=True):
+
+async def test_agent(
+    env,
+    agent,
+    q_plot_interval,
+    q_plot=True,
+    recorder=None,
+    plan_horizon=1,
+    q_subscriber=None,
+):
+    """
+    plan_horizon: 2以上にすると，Qテーブルから最大plan_horizonセル先までの経路を決め，
+                  toioを止めずにまとめて移動させる（目標が動いたら計画し直す）
+    q_subscriber: 指定すると，ステップの合間に学習中のQを受け取り，agentのQを差し替える
+    """
     if q_plot:
         q_plotter = QPlotter(env)
 
@@ -17,18 +42,39 @@ async def test_agent(env, agent, q_plot_interval, q_plot=True):
 
         for step in range(10000):
             print(f"\n--- ステップ {step + 1} ---")
-            action = agent.greedy(state)
-            state, reward, _, _, _ = await env.step(action)
+            if q_subscriber is not None and (snapshot := q_subscriber.poll()):
+                version, train_step, Q = snapshot
+                swap_q(agent, Q)
+                print(f"Qを更新しました（{version=}, {train_step=}）")
+            if plan_horizon > 1:
+                actions = env.plan_actions(agent.greedy, plan_horizon)
+                results = await env.step_plan(actions)
+            else:
+                actions = [agent.greedy(state)]
+                results = [await env.step(actions[0])]
+            for action, (next_state, reward, _, _, info) in zip(actions, results):
+                if recorder is not None:
+                    recorder.record(state, action, reward, next_state, info)
+                state = next_state
             env.render()
             # if step % q_plot_interval == 0:
             #   q_plotter.plot_q(Q=agent.Q)
             if q_plot:
                 q_plotter.plot_q(Q=agent.Q)
             print(f"状態:{state}, 報酬:{reward}")
-            await asyncio.sleep(1.0)  # 可視化が遅れるので必須
+            if plan_horizon == 1 or q_plot:
+                await asyncio.sleep(1.0)  # 可視化が遅れるので必須
+            elif not any(info["moved"] for *_, info in results):
+                # 壁に向かう行動ではtoioを動かさずawaitもしないため，ここで待たないと
+                # 座標の通知（目標の移動）を受け取れないままループが空回りする
+                await asyncio.sleep(0.1)
     except KeyboardInterrupt:
         print("\nCtrl+C を受け取りました。終了します。")
     finally:
+        if q_subscriber is not None:
+            q_subscriber.close()
+        if recorder is not None:
+            recorder.close()
         await env.close()
 
 
@@ -53,12 +99,40 @@ if __name__ == "__main__":
 
     Q_FILE_NAME = "q_epsilon0_1_step1000000_reward1_0.npy"
     Q_PLOT = False
+    # 実機での遷移を書き出すファイル名（不要ならNone）．transition_recorder.pyで再学習・評価できる
+    RECORD_FILE_NAME = None
+    # 何セル先までまとめて移動させるか（1なら1セルずつ止まりながら移動）
+    PLAN_HORIZON = 1
+    # demo2_train.pyのPUBLISH_Qで公開されているQを実行中に受け取るか（toioを繋いだまま方策が更新される）
+    SUBSCRIBE_Q = False
+    Q_CHANNEL = "toio_rl_q"
 
     env = OnlineEnv(agent_name="toio-38B", target_name="toio-589")
-    agent = QTableAgent(
-        env.observation_space,
-        env.action_space,
+    if Q_PLOT:
+        from q_learning import QTableAgent
+
+        agent = QTableAgent(
+            env.observation_space,
+            env.action_space,
+        )
+        agent.load_q(Q_FILE_NAME)
+    else:
+        # Qの可視化が不要なら，貪欲方策だけを表にしたものを使う
+        # （`python policy_table.py <Q>.npy <方策>.npy`で書き出したものはPolicyTable.loadで読める）
+        agent = PolicyTable.from_q(np.load(Q_FILE_NAME))
+
+    recorder = (
+        TransitionRecorder(RECORD_FILE_NAME) if RECORD_FILE_NAME is not None else None
     )
-    agent.load_q(Q_FILE_NAME)
 
-    asyncio.run(test_agent(env, agent, q_plot_interval=1, q_plot=Q_PLOT))
+    asyncio.run(
+        test_agent(
+            env,
+            agent,
+            q_plot_interval=1,
+            q_plot=Q_PLOT,
+            recorder=recorder,
+            plan_horizon=PLAN_HORIZON,
+            q_subscriber=QSubscriber(Q_CHANNEL) if SUBSCRIBE_Q else None,
+        )
+    )
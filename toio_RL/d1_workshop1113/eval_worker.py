@@ -0,0 +1,123 @@
+import multiprocessing as mp
+import queue
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from toio_RL.common.shared_q import SharedQTable
+
+
+class EvalResult(NamedTuple):
+    step: int
+    eval_reward: float
+    finished_at: float
+    q_norm: float
+
+
+class AsyncEvaluator:
+    """
+    Evaluate Q snapshots in a separate process while training continues.
+    `submit` copies Q into shared memory under a new version and returns
+    immediately. The worker always evaluates the newest version it has not
+    seen yet (intermediate versions are skipped if it falls behind), and
+    streams results back tagged with the training step.
+    """
+
+    def __init__(
+        self,
+        shape,
+        env_kwargs: Optional[Dict[str, Any]] = None,
+        eval_steps: int = 100,
+        seed: Optional[int] = None,
+    ):
+        """
+        shape: Qテーブルの形 (状態数, 行動数)
+        env_kwargs: ワーカー内で評価用のOfflineEnvを作るときの引数
+        eval_steps: 1回の評価で行動を選択するステップ数
+        """
+        self._shared = SharedQTable.create(shape)
+        self._wake = mp.Event()
+        self._stop = mp.Event()
+        self._results = mp.Queue()
+        self._process = mp.Process(
+            target=_eval_loop,
+            args=(
+                self._shared.name,
+                env_kwargs or {},
+                eval_steps,
+                seed,
+                self._wake,
+                self._stop,
+                self._results,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        self._closed = False
+
+    def submit(self, Q: np.ndarray, step: int) -> int:
+        version = self._shared.publish(Q, step)
+        self._wake.set()
+        return version
+
+    def poll(self) -> List[EvalResult]:
+        """Return the results that have arrived so far without blocking."""
+        results = []
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                return results
+            if result is not None:
+                results.append(EvalResult(*result))
+
+    def close(self) -> List[EvalResult]:
+        """Wait until the latest submitted Q is evaluated and stop the worker."""
+        if self._closed:
+            return []
+        self._closed = True
+        self._stop.set()
+        self._wake.set()
+        results = []
+        # ワーカーは終了時にNoneを送る．join前にキューを空にしないと詰まることがある
+        while (result := self._results.get()) is not None:
+            results.append(EvalResult(*result))
+        self._process.join()
+        self._shared.close()
+        return results
+
+
+def _eval_loop(shm_name, env_kwargs, eval_steps, seed, wake, stop, results) -> None:
+    from gymnasium.spaces import Discrete
+
+    from offline_env import OfflineEnv
+    from q_learning import QTableAgent
+
+    shared = SharedQTable.attach(shm_name)
+    env = OfflineEnv(**env_kwargs)
+    agent = QTableAgent(
+        env.observation_space, Discrete(shared.shape[1]), epsilon=0.0, seed=seed
+    )
+    last_version = 0
+    try:
+        while True:
+            wake.wait()
+            wake.clear()
+            stopping = stop.is_set()
+            snapshot = shared.read(min_version=last_version)
+            if snapshot is not None:
+                last_version, step, agent.Q = snapshot
+                eval_reward_sum = 0.0
+                state, _ = env.reset()
+                for _ in range(eval_steps):
+                    state, reward, _, _, _ = env.step(agent.greedy(state))
+                    eval_reward_sum += reward
+                results.put(
+                    (step, eval_reward_sum, time.time(), float(np.linalg.norm(agent.Q)))
+                )
+            if stopping:
+                break
+    finally:
+        results.put(None)
+        shared.close()
@@ -0,0 +1,249 @@
+from typing import Tuple
+
+import numpy as np
+
+
+class GridMarkovModel:
+    """
+    Exact transition model of OfflineEnv over (agent cell, target cell, life).
+    For each action the next state is stored as a sparse index array: either a
+    state index (the target stays) or a respawn source (agent cell, old target).
+    Respawns are uniform over the other free cells and over life_range, so they
+    are applied as one dense (n_cells, n_cells) operation instead of expanding
+    every respawn into n_cells * n_lives matrix entries.
+    """
+
+    # offline_env.Actionと同じ並び（UP, DOWN, LEFT, RIGHT）
+    MOVES = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+    def __init__(
+        self,
+        grid_width: int = 7,
+        grid_height: int = 5,
+        life_range: Tuple[int, int] = (1, 6),
+        goal_reward: float = 1.0,
+    ):
+        if life_range[0] < 1:
+            raise ValueError("life_range must start from 1 or more")
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.n_cells = n = grid_width * grid_height
+        self.max_life = life_range[1] - 1
+        self.lives = np.arange(life_range[0], life_range[1])
+        self.goal_reward = goal_reward
+        self.n_states = n * n * self.max_life
+
+        # 状態 s = (agent * n + target) * max_life + (life - 1)
+        s = np.arange(self.n_states)
+        agent, rest = np.divmod(s, n * self.max_life)
+        target, life_idx = np.divmod(rest, self.max_life)
+        life = life_idx + 1
+        # Qテーブルの状態（agent * n + target）
+        self.obs_index = agent * n + target
+
+        x, y = agent % grid_width, agent // grid_width
+        self.next_state = np.full((len(self.MOVES), self.n_states), -1)
+        self.respawn_source = np.full((len(self.MOVES), self.n_states), -1)
+        self.reward = np.zeros((self.n_states, len(self.MOVES)))
+        for a, (dx, dy) in enumerate(self.MOVES):
+            nx, ny = x + dx, y + dy
+            inside = (0 <= nx) & (nx < grid_width) & (0 <= ny) & (ny < grid_height)
+            next_agent = np.where(inside, ny * grid_width + nx, agent)
+            reached = next_agent == target
+            respawn = reached | (life - 1 <= 0)
+            self.reward[:, a] = np.where(reached, goal_reward, 0.0)
+            self.next_state[a] = np.where(
+                respawn, -1, (next_agent * n + target) * self.max_life + life_idx - 1
+            )
+            self.respawn_source[a] = np.where(respawn, next_agent * n + target, -1)
+
+        # 再配置先の候補数（エージェントと元の目標のセルを除く）
+        self._n_free = np.where(np.eye(n, dtype=bool), n - 1, n - 2)
+
+    @classmethod
+    def from_env(cls, env) -> "GridMarkovModel":
+        return cls(env.grid_width, env.grid_height, env.life_range, env.goal_reward)
+
+    def initial_distribution(self) -> np.ndarray:
+        """State distribution right after OfflineEnv.reset()."""
+        n = self.n_cells
+        d = np.zeros((n, n, self.max_life))
+        d[:, :, self.lives - 1] = 1.0
+        d[np.arange(n), np.arange(n)] = 0.0
+        return (d / d.sum()).ravel()
+
+    def greedy_policy(self, Q: np.ndarray) -> np.ndarray:
+        """Action probabilities of QTableAgent.greedy (uniform over ties) per state."""
+        is_max = Q == Q.max(axis=1, keepdims=True)
+        pi = is_max / is_max.sum(axis=1, keepdims=True)
+        return pi[self.obs_index]
+
+    def chain(self, policy: np.ndarray) -> "MarkovChain":
+        """policy: action probabilities of shape (n_states, n_actions)."""
+        return MarkovChain(self, policy)
+
+    def greedy_chain(self, Q: np.ndarray) -> "MarkovChain":
+        return MarkovChain(self, self.greedy_policy(Q))
+
+    def respawn(self, mass: np.ndarray) -> np.ndarray:
+        """
+        Spread mass arriving at (agent cell, old target) over respawned targets
+        and lives. Returns a state distribution (n_states,).
+        """
+        n = self.n_cells
+        w = mass.reshape(n, n) / self._n_free
+        # 新しい目標 t への流入 = 元の目標が t 以外だったものの和（t == agent は除く）
+        new_target = w.sum(axis=1, keepdims=True) - w
+        new_target[np.arange(n), np.arange(n)] = 0.0
+        out = np.zeros((n, n, self.max_life))
+        out[:, :, self.lives - 1] = new_target[:, :, None] / len(self.lives)
+        return out.ravel()
+
+    def respawn_value(self, V: np.ndarray) -> np.ndarray:
+        """Expected V after a respawn, for each (agent cell, old target)."""
+        n = self.n_cells
+        v_bar = V.reshape(n, n, self.max_life)[:, :, self.lives - 1].mean(axis=2)
+        total = v_bar.sum(axis=1, keepdims=True)
+        diag = np.diag(v_bar)[:, None]
+        expected = (total - diag - v_bar) / self._n_free
+        expected[np.arange(n), np.arange(n)] = (total[:, 0] - diag[:, 0]) / (n - 1)
+        return expected.ravel()
+
+    def optimal_policy(
+        self, gamma: float = 0.99, tol: float = 1e-8, max_iter: int = 10**4
+    ) -> np.ndarray:
+        """
+        Deterministic policy from discounted value iteration on the full state
+        (including the target life, which the Q table cannot observe).
+        Serves as an upper reference for greedy policies of Q tables.
+        """
+        V = np.zeros(self.n_states)
+        for _ in range(max_iter):
+            q = self._backup(V, gamma)
+            V_new = q.max(axis=1)
+            if np.max(np.abs(V_new - V)) < tol:
+                break
+            V = V_new
+        policy = np.zeros_like(q)
+        policy[np.arange(self.n_states), q.argmax(axis=1)] = 1.0
+        return policy
+
+    # ----- private methods -----
+
+    def _backup(self, V: np.ndarray, gamma: float) -> np.ndarray:
+        v_respawn = self.respawn_value(V)
+        q = self.reward.copy()
+        for a in range(len(self.MOVES)):
+            nr = self.next_state[a]
+            q[:, a] += gamma * np.where(
+                nr >= 0, V[nr], v_respawn[self.respawn_source[a]]
+            )
+        return q
+
+
+class MarkovChain:
+    """Markov chain induced by a policy on GridMarkovModel."""
+
+    def __init__(self, model: GridMarkovModel, policy: np.ndarray):
+        self.model = model
+        self.policy = policy
+        # 期待即時報酬
+        self.reward = (policy * model.reward).sum(axis=1)
+
+        # 目標が残る遷移（疎行列のCOO形式）と，再配置に流れる遷移
+        rows, cols, probs = [], [], []
+        respawn_rows, respawn_cols, respawn_probs = [], [], []
+        for a in range(policy.shape[1]):
+            p = policy[:, a]
+            stay = (p > 0) & (model.next_state[a] >= 0)
+            rows.append(np.flatnonzero(stay))
+            cols.append(model.next_state[a][stay])
+            probs.append(p[stay])
+            move = (p > 0) & (model.respawn_source[a] >= 0)
+            respawn_rows.append(np.flatnonzero(move))
+            respawn_cols.append(model.respawn_source[a][move])
+            respawn_probs.append(p[move])
+        self.rows = np.concatenate(rows)
+        self.cols = np.concatenate(cols)
+        self.probs = np.concatenate(probs)
+        self.respawn_rows = np.concatenate(respawn_rows)
+        self.respawn_cols = np.concatenate(respawn_cols)
+        self.respawn_probs = np.concatenate(respawn_probs)
+
+    def step(self, d: np.ndarray) -> np.ndarray:
+        """Propagate a state distribution by one step."""
+        n_states = self.model.n_states
+        out = np.bincount(
+            self.cols, weights=d[self.rows] * self.probs, minlength=n_states
+        )
+        mass = np.bincount(
+            self.respawn_cols,
+            weights=d[self.respawn_rows] * self.respawn_probs,
+            minlength=self.model.n_cells**2,
+        )
+        return out + self.model.respawn(mass)
+
+    def finite_horizon_reward(self, horizon: int, d0: np.ndarray = None) -> float:
+        """Expected summed reward over `horizon` steps from reset (= eval_steps rollout)."""
+        d = self.model.initial_distribution() if d0 is None else d0
+        total = 0.0
+        for _ in range(horizon):
+            total += d @ self.reward
+            d = self.step(d)
+        return float(total)
+
+    def stationary_distribution(
+        self, tol: float = 1e-12, max_iter: int = 10**5
+    ) -> np.ndarray:
+        # 周期的な連鎖でも収束するよう，遅延させた遷移 (I + P) / 2 で反復する
+        d = self.model.initial_distribution()
+        for _ in range(max_iter):
+            d_new = 0.5 * (d + self.step(d))
+            if np.abs(d_new - d).sum() < tol:
+                return d_new
+            d = d_new
+        return d
+
+    def average_reward(self, **kwargs) -> float:
+        """Expected reward per step under the stationary distribution."""
+        return float(self.stationary_distribution(**kwargs) @ self.reward)
+
+
+def evaluate_q(Q: np.ndarray, env, horizon: int = 100) -> Tuple[float, float]:
+    """
+    Exact evaluation of QTableAgent.greedy on OfflineEnv.
+    Returns (expected summed reward over `horizon` steps, expected reward per step).
+    """
+    chain = GridMarkovModel.from_env(env).greedy_chain(Q)
+    return chain.finite_horizon_reward(horizon), chain.average_reward()
+
+
+if __name__ == "__main__":
+    """
+    Qテーブルの貪欲方策を厳密に評価し，最適方策と比較する
+    python markov_eval.py q_epsilon0_1_step1000000_reward1_0.npy
+    """
+    import sys
+    import time
+
+    from offline_env import OfflineEnv
+
+    Q_FILE_NAME = (
+        sys.argv[1] if len(sys.argv) > 1 else "q_epsilon0_1_step1000000_reward1_0.npy"
+    )
+    LIFE_RANGE = (35, 36)
+    EVAL_STEPS = 100
+
+    env = OfflineEnv(life_range=LIFE_RANGE)
+    model = GridMarkovModel.from_env(env)
+    start = time.time()
+    greedy = model.greedy_chain(np.load(Q_FILE_NAME))
+    print(
+        f"greedy : {EVAL_STEPS} step reward {greedy.finite_horizon_reward(EVAL_STEPS):.3f}, "
+        f"reward/step {greedy.average_reward():.4f} ({time.time() - start:.2f} s)"
+    )
+    optimal = model.chain(model.optimal_policy(gamma=0.99))
+    print(
+        f"optimal: {EVAL_STEPS} step reward {optimal.finite_horizon_reward(EVAL_STEPS):.3f}, "
+        f"reward/step {optimal.average_reward():.4f}"
+    )
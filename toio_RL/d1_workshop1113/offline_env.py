@@ -1,11 +1,8 @@
 from typing import Optional, Tuple, Dict, Any, List
 from enum import IntEnum
 
-import numpy as np
+import gymnasium as gym
 from gymnasium.spaces import Discrete
-from gymnasium.utils import seeding
-
-from toio_RL.common.keyboard_input import read_action, Key
 
 
 class Action(IntEnum):
@@ -15,11 +12,15 @@ class Action(IntEnum):
     RIGHT = 3
 
 
-class OfflineEnv:
+class OfflineEnv(gym.Env):
     """
     Offline environment for collecting a target on a grid.
+    Registered as ENV_ID, so gym.make(ENV_ID, grid_width=..., life_range=...,
+    goal_reward=...) and gymnasium.vector can create it in worker processes.
     """
 
+    metadata = {"render_modes": ["ansi"], "render_fps": 4}
+
     def __init__(
         self,
         grid_width: int = 7,
@@ -40,7 +41,6 @@ class OfflineEnv:
         self._target_pos: Tuple[int, int] = (0, 0)
         self._target_life: int = 0
         self._step_count: int = 0
-        self._rng: Optional[np.random.Generator] = None
         self.render_mode = render_mode
 
         self.goal_reward = goal_reward
@@ -51,12 +51,15 @@ class OfflineEnv:
         """
         Returns: observation, info dict
         """
-        self._rng, _ = seeding.np_random(seed)
+        # seedが指定されたときだけ，self.np_random（乱数生成器）を初期化し直す
+        super().reset(seed=seed)
         self._step_count = 0
         self._agent_pos = (
-            self._rng.integers(0, self.grid_width),
-            self._rng.integers(0, self.grid_height),
+            int(self.np_random.integers(0, self.grid_width)),
+            int(self.np_random.integers(0, self.grid_height)),
         )
+        # 前回の目標位置に依存しないよう，目標はエージェント以外のセルから選ぶ
+        self._target_pos = self._agent_pos
         self._respawn_target()
         observation = self.get_observation()
         return observation, {}
@@ -137,15 +140,25 @@ class OfflineEnv:
             for y in range(self.grid_height)
             if (x, y) not in (self._agent_pos, self._target_pos)
         ]
-        assert self._rng is not None
-        choice = self._rng.choice(free)
+        choice = int(self.np_random.choice(free))
         self._target_pos = self.index_to_pos(choice)
         self._target_life = int(
-            self._rng.integers(self.life_range[0], self.life_range[1])
+            self.np_random.integers(self.life_range[0], self.life_range[1])
         )
 
 
+ENV_ID = "toio_RL/OfflineEnv-v0"
+# offline_envとtoio_RL.d1_workshop1113.offline_envの両方でimportされても1回だけ登録する
+if ENV_ID not in gym.registry:
+    gym.register(
+        id=ENV_ID, entry_point="toio_RL.d1_workshop1113.offline_env:OfflineEnv"
+    )
+
+
 def test_with_keyboard() -> None:
+    # readcharはキーボード操作時にしか使わないため，ここでimportする
+    from toio_RL.common.keyboard_input import read_action, Key
+
     print(
         "矢印キーでエージェントの行動を指定（↑, ↓, ←, →）。終了は 'q' または Ctrl+C。"
     )
@@ -1,22 +1,16 @@
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List, Sequence, TYPE_CHECKING
 import asyncio
+import time
 from enum import IntEnum
 import logging
 
 import numpy as np
 from gymnasium.spaces import Discrete
 from gymnasium.utils import seeding
-from toio.simple import AsyncSimpleCube
-from toio import (
-    MovementType,
-    ToioRelativeCoordinateSystem,
-    IdInformation,
-    PositionId,
-    PositionIdMissed,
-    StandardIdMissed,
-)
-
-from toio_RL.common.keyboard_input import read_action_async, Key
+
+# toio（bleak）は読み込みが重いため，キューブを扱うメソッド内でimportする
+if TYPE_CHECKING:
+    from toio.simple import AsyncSimpleCube
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +43,9 @@ class OnlineEnv:
         if not agent_name:
             raise ValueError("agent_nameを設定してください")
 
+        from toio.simple import AsyncSimpleCube
+        from toio import ToioRelativeCoordinateSystem
+
         # toioの初期化, target_nameにidが指定されていなければ，仮想的なりんごを設定
         self._use_physical_target = target_name is not None
         names = [agent_name] + ([target_name] if self._use_physical_target else [])
@@ -95,32 +92,80 @@ class OnlineEnv:
     async def step(self, action: int) -> Tuple[int, float, bool, bool, Dict]:
         """
         Returns: observation, reward, terminated, truncated, info dict
+        info: t_cmd（移動指令の時刻），t_obs（観測の時刻），
+              moved（移動指令を出したか），arrived（目標セルに到達したか），
+              position_lost（座標を読み取れていないtoioがあるか）
         """
-        self._step_count += 1
-        self._target_life -= 1
-
-        dx, dy = {
-            Action.UP: (0, -1),
-            Action.DOWN: (0, 1),
-            Action.LEFT: (-1, 0),
-            Action.RIGHT: (1, 0),
-        }[Action(action)]
-
-        new_x = self._agent_pos[0] + dx
-        new_y = self._agent_pos[1] + dy
-        if 0 <= new_x < self.grid_width and 0 <= new_y < self.grid_height:
-            mat_x, mat_y = self.pos_to_matcell((new_x, new_y))
-            await self.cubes[0].move_to_the_grid_cell(
+        new_pos = self.next_pos(self._agent_pos, action)
+        moved = new_pos != self._agent_pos
+        arrived = False
+        t_cmd = time.time()
+        if moved:
+            mat_x, mat_y = self.pos_to_matcell(new_pos)
+            arrived = await self.cubes[0].move_to_the_grid_cell(
                 cell_x=mat_x, cell_y=mat_y, speed=100
             )
+        return self._finish_step(t_cmd, moved, arrived)
 
-        reward = self.get_reward()
-
-        if not self._use_physical_target and self._target_life <= 0:
-            self._respawn_target()
+    async def step_plan(
+        self, actions: Sequence[int], speed: int = 100
+    ) -> List[Tuple[int, float, bool, bool, Dict]]:
+        """
+        Execute a short plan of actions as one multi-target trajectory,
+        so the cube does not stop at every cell.
+        Each cell passed is returned as one step of the same MDP as step().
+        The plan is cut at walls and at the target cell, and the rest of the
+        trajectory is cancelled when the target moves, so the caller can re-plan.
+        Returns: list of (observation, reward, terminated, truncated, info)
+        """
+        cells = []
+        pos = self._agent_pos
+        for action in actions:
+            next_pos = self.next_pos(pos, action)
+            if next_pos == pos:
+                break
+            cells.append(next_pos)
+            pos = next_pos
+            if pos == self._target_pos:
+                break
+        if len(cells) <= 1:
+            return [await self.step(actions[0])]
+
+        target_pos = self._target_pos
+        t_start = t_cmd = time.time()
+        await self._send_trajectory(cells, speed)
+        results = []
+        for i, cell in enumerate(cells):
+            arrived = await self._wait_for_cell(
+                cell, t_start + (i + 1) * self.cubes[0].DEFAULT_TIMEOUT
+            )
+            results.append(self._finish_step(t_cmd, True, arrived))
+            t_cmd = results[-1][4]["t_obs"]
+            if not arrived or self._target_pos != target_pos:
+                # 目標が動いた（or 到達できなかった）ので，残りの軌道を取り消して止まる
+                if i + 1 < len(cells):
+                    await self._send_trajectory([self._agent_pos], speed)
+                break
+        return results
 
-        observation = self.get_observation()
-        return observation, reward, False, False, {}
+    def plan_actions(self, greedy, horizon: int) -> List[int]:
+        """
+        Follow greedy(state) on the grid from the current positions,
+        assuming the target stays where it is, for up to `horizon` actions.
+        """
+        actions = []
+        pos = self._agent_pos
+        for _ in range(horizon):
+            state = self.pos_to_index(pos) * self.n_cells + self.pos_to_index(
+                self._target_pos
+            )
+            action = int(greedy(state))
+            actions.append(action)
+            next_pos = self.next_pos(pos, action)
+            if next_pos == pos or next_pos == self._target_pos:
+                break
+            pos = next_pos
+        return actions
 
     def get_observation(self) -> int:
         return self.pos_to_index(self._agent_pos) * self.n_cells + self.pos_to_index(
@@ -135,6 +180,20 @@ class OnlineEnv:
     def pos_to_index(self, xy: Tuple[int, int]) -> int:
         return xy[1] * self.grid_width + xy[0]
 
+    def next_pos(self, xy: Tuple[int, int], action: int) -> Tuple[int, int]:
+        """Grid cell reached by an action (the agent stays at walls)."""
+        dx, dy = {
+            Action.UP: (0, -1),
+            Action.DOWN: (0, 1),
+            Action.LEFT: (-1, 0),
+            Action.RIGHT: (1, 0),
+        }[Action(action)]
+        new_x = xy[0] + dx
+        new_y = xy[1] + dy
+        if 0 <= new_x < self.grid_width and 0 <= new_y < self.grid_height:
+            return (new_x, new_y)
+        return xy
+
     def index_to_pos(self, idx: int) -> Tuple[int, int]:
         return idx % self.grid_width, idx // self.grid_width
 
@@ -171,6 +230,8 @@ class OnlineEnv:
 
     async def _initialize_cubes(self) -> None:
         """Connect cubes and register position notification handlers."""
+        from toio import MovementType
+
         self._fail_flag = {}
         for idx, cube in enumerate(self.cubes):
             cube.DEFAULT_MOVEMENT_TYPE = MovementType.Linear
@@ -186,7 +247,73 @@ class OnlineEnv:
             await cube._cube.api.id_information.register_notification_handler(handler)
         await asyncio.sleep(1)
 
-    def _make_id_handler(self, name: str, is_target: bool, cube: AsyncSimpleCube):
+    def _finish_step(
+        self, t_cmd: float, moved: bool, arrived: bool
+    ) -> Tuple[int, float, bool, bool, Dict]:
+        self._step_count += 1
+        self._target_life -= 1
+
+        reward = self.get_reward()
+
+        if not self._use_physical_target and self._target_life <= 0:
+            self._respawn_target()
+
+        observation = self.get_observation()
+        info = {
+            "t_cmd": t_cmd,
+            "t_obs": time.time(),
+            "moved": moved,
+            "arrived": bool(arrived),
+            "position_lost": any(self._fail_flag.values()),
+        }
+        return observation, reward, False, False, info
+
+    async def _send_trajectory(self, cells: List[Tuple[int, int]], speed: int) -> None:
+        """Send grid cells to the agent cube as one multi-target motor command."""
+        from toio import (
+            CubeLocation,
+            RotationOption,
+            Speed,
+            TargetPosition,
+            WriteMode,
+        )
+
+        cube = self.cubes[0]
+        if cube._location is None or cube._native_location is None:
+            return
+        targets = []
+        for cell in cells:
+            # AsyncSimpleCube.move_toと同じ変換（相対座標 -> 絶対座標 -> マット内に収める）
+            point = cube._cell_to_point(*self.pos_to_matcell(cell))
+            location = cube._location
+            location.relative_location = CubeLocation(point=point, angle=0)
+            targets.append(
+                TargetPosition(
+                    cube_location=cube._native_location.get_boundary_point(
+                        location.to_absolute_location()
+                    ),
+                    rotation_option=RotationOption.WithoutRotation,
+                )
+            )
+        await cube._cube.api.motor.motor_control_multiple_targets(
+            timeout=min(255, cube.DEFAULT_TIMEOUT * len(cells)),
+            movement_type=cube.DEFAULT_MOVEMENT_TYPE,
+            speed=Speed(max=speed),
+            mode=WriteMode.Overwrite,
+            target_list=targets,
+        )
+
+    async def _wait_for_cell(self, cell: Tuple[int, int], deadline: float) -> bool:
+        """Wait until the position handler reports the agent on `cell`."""
+        while self._agent_pos != cell:
+            if time.time() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def _make_id_handler(self, name: str, is_target: bool, cube: "AsyncSimpleCube"):
+        from toio import IdInformation, PositionId, PositionIdMissed, StandardIdMissed
+
         def handler(payload: bytearray) -> None:
             info = IdInformation.is_my_data(payload)
             if cube._location is None or isinstance(
@@ -228,6 +355,8 @@ class OnlineEnv:
 
 
 async def test_with_keyboard():
+    from toio_RL.common.keyboard_input import read_action_async, Key
+
     print(
         "矢印キーでエージェントの行動を指定（↑, ↓, ←, →）。終了は 'q' または Ctrl+C。"
     )
@@ -0,0 +1,67 @@
+import random
+import sys
+from typing import Optional
+
+import numpy as np
+
+# 行動数4までを想定．各状態の値は最大Q値をとる行動集合のビットマスク（1〜15）
+MAX_ACTIONS = 4
+# ビットマスク -> 候補となる行動のタプル
+_TIE_ACTIONS = tuple(
+    tuple(a for a in range(MAX_ACTIONS) if mask >> a & 1)
+    for mask in range(1 << MAX_ACTIONS)
+)
+
+
+def compile_policy(Q: np.ndarray) -> np.ndarray:
+    """
+    Compile a Q table of shape (num_states, num_actions) into an int8 table.
+    Each entry is the bitmask of the actions that share the maximum Q value.
+    """
+    Q = np.asarray(Q)
+    if Q.ndim != 2 or Q.shape[1] > MAX_ACTIONS:
+        raise ValueError(f"Q must have shape (num_states, <= {MAX_ACTIONS})")
+    is_max = Q == Q.max(axis=1, keepdims=True)
+    weights = 1 << np.arange(Q.shape[1])
+    return (is_max * weights).sum(axis=1).astype(np.int8)
+
+
+def export_policy(q_path, policy_path) -> None:
+    """Compile a saved Q table (.npy) and save the packed policy (.npy)."""
+    np.save(policy_path, compile_policy(np.load(q_path)))
+
+
+class PolicyTable:
+    """
+    Greedy policy compiled from a Q table.
+    Only needs numpy, and `greedy` has the same signature as QTableAgent.greedy,
+    so it can replace the agent in OnlineEnv control loops.
+    """
+
+    def __init__(self, table: np.ndarray, seed: Optional[int] = None):
+        self.table = table.tolist()
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def load(cls, path, seed: Optional[int] = None) -> "PolicyTable":
+        return cls(np.load(path), seed=seed)
+
+    @classmethod
+    def from_q(cls, Q: np.ndarray, seed: Optional[int] = None) -> "PolicyTable":
+        return cls(compile_policy(Q), seed=seed)
+
+    def set_q(self, Q: np.ndarray) -> None:
+        """Recompile from a new Q table. The table is swapped in one assignment."""
+        self.table = compile_policy(Q).tolist()
+
+    def greedy(self, state) -> int:
+        candidates = _TIE_ACTIONS[self.table[state]]
+        if len(candidates) == 1:
+            return candidates[0]
+        # 同値の行動からランダムに１つ選ぶ（QTableAgent.greedyと同じ挙動）
+        return self._rng.choice(candidates)
+
+
+if __name__ == "__main__":
+    # 使い方: python policy_table.py <Qテーブル.npy> <書き出し先.npy>
+    export_policy(sys.argv[1], sys.argv[2])
@@ -0,0 +1,181 @@
+import heapq
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from q_learning import QTableAgent
+
+
+class PrioritizedSweepingAgent(QTableAgent):
+    """
+    Q-learning with prioritized sweeping over the known grid model.
+    After each real update, pairs whose |TD error| under the model exceeds
+    theta are kept in a priority queue, and up to n_planning of them are
+    backed up, pushing their grid predecessors back into the queue.
+
+    The model follows the grid rules of OfflineEnv/OnlineEnv: the agent moves
+    deterministically (staying at walls), and reaching the target gives
+    goal_reward and respawns the target uniformly on another cell. Target
+    respawns caused by its lifetime are not in the model; those are only
+    learned from real transitions.
+    """
+
+    # offline_env.Action/online_env.Actionと同じ並び（UP, DOWN, LEFT, RIGHT）
+    MOVES = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+    def __init__(
+        self,
+        env,
+        alpha=0.1,
+        gamma=0.99,
+        epsilon=0.1,
+        seed=None,
+        n_planning=10,
+        theta=1e-4,
+        planning_alpha=None,
+    ):
+        """
+        env: grid_width, grid_height, observation_space, action_spaceを持つ環境
+        n_planning: 1回の実遷移ごとに行うモデルからの更新の最大回数
+        theta: 優先度付きキューに積む|TD誤差|の下限
+        planning_alpha: モデルからの更新の学習率（Noneならalphaと同じ）
+        """
+        super().__init__(
+            env.observation_space,
+            env.action_space,
+            alpha=alpha,
+            gamma=gamma,
+            epsilon=epsilon,
+            seed=seed,
+        )
+        self.n_planning = n_planning
+        self.theta = theta
+        self.planning_alpha = alpha if planning_alpha is None else planning_alpha
+        self.goal_reward = getattr(env, "goal_reward", 1.0)
+
+        self.n_cells = env.grid_width * env.grid_height
+        self._next_cell, self._predecessors = self._build_model(
+            env.grid_width, env.grid_height
+        )
+        self._queue: List[Tuple[float, int, int]] = []
+        self._priority: Dict[Tuple[int, int], float] = {}
+        self.num_backups = 0
+
+    def update(self, state, action, reward, next_state, done):
+        td_error = super().update(state, action, reward, next_state, done)
+        self._push(state, action)
+        self._sweep()
+        return td_error
+
+    # ----- private methods -----
+
+    def _build_model(self, width: int, height: int):
+        """
+        Returns the next agent cell for each (cell, action) and, for each state,
+        the (state, action) pairs whose model backup depends on its Q values.
+        """
+        n = self.n_cells
+        next_cell = np.empty((n, len(self.MOVES)), dtype=np.int64)
+        for cell in range(n):
+            x, y = cell % width, cell // width
+            for a, (dx, dy) in enumerate(self.MOVES):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    next_cell[cell, a] = ny * width + nx
+                else:
+                    next_cell[cell, a] = cell
+
+        predecessors: List[List[Tuple[int, int]]] = [[] for _ in range(n * n)]
+        for cell in range(n):
+            for a in range(len(self.MOVES)):
+                dest = next_cell[cell, a]
+                # 目標に届かない移動: (cell, t) -> (dest, t)
+                for target in range(n):
+                    if target != dest:
+                        predecessors[dest * n + target].append((cell * n + target, a))
+                # 目標に届く移動: (cell, dest) -> (dest, 任意の目標)
+                for target in range(n):
+                    if target != dest:
+                        predecessors[dest * n + target].append((cell * n + dest, a))
+        return next_cell, predecessors
+
+    def _model_target(self, state: int, action: int) -> float:
+        n = self.n_cells
+        agent_cell, target_cell = divmod(state, n)
+        dest = self._next_cell[agent_cell, action]
+        if dest != target_cell:
+            return self.gamma * float(np.max(self.Q[dest * n + target_cell]))
+        # 目標に到達すると，目標は自分以外のセルに一様に再配置される
+        v_next = np.max(self.Q[dest * n : (dest + 1) * n], axis=1)
+        v_respawn = (v_next.sum() - v_next[dest]) / (n - 1)
+        return self.goal_reward + self.gamma * float(v_respawn)
+
+    def _push(self, state: int, action: int) -> None:
+        priority = abs(self._model_target(state, action) - self.Q[state, action])
+        key = (state, action)
+        if priority > max(self.theta, self._priority.get(key, 0.0)):
+            self._priority[key] = priority
+            heapq.heappush(self._queue, (-priority, state, action))
+
+    def _sweep(self) -> None:
+        for _ in range(self.n_planning):
+            # 優先度が更新された古いエントリは読み飛ばす
+            while self._queue:
+                neg_priority, state, action = heapq.heappop(self._queue)
+                if self._priority.get((state, action)) == -neg_priority:
+                    break
+            else:
+                return
+            del self._priority[(state, action)]
+            td_error = self._model_target(state, action) - self.Q[state, action]
+            self.Q[state, action] += self.planning_alpha * td_error
+            self.num_backups += 1
+            for prev_state, prev_action in self._predecessors[state]:
+                self._push(prev_state, prev_action)
+
+
+if __name__ == "__main__":
+    """
+    通常のQ学習と優先度付きスイーピングで，評価報酬が目標値に達するまでの学習ステップ数を比較する
+    python prioritized_sweeping.py
+    """
+    import time
+
+    from demo2_train import train
+    from offline_env import OfflineEnv
+
+    NUM_STEPS = 5 * 10**4
+    EVAL_INTERVAL = 10**3
+    GOAL_REWARD = 1.0
+    LIFE_RANGE = (35, 36)
+    # 評価100stepで到達してほしい回数
+    TARGET_REWARD = 10 * GOAL_REWARD
+    SEED = 0
+
+    def make_env():
+        return OfflineEnv(life_range=LIFE_RANGE, goal_reward=GOAL_REWARD)
+
+    results = {}
+    for name in ("q_learning", "prioritized_sweeping"):
+        env = make_env()
+        if name == "q_learning":
+            agent = QTableAgent(
+                env.observation_space, env.action_space, gamma=0.9, seed=SEED
+            )
+        else:
+            agent = PrioritizedSweepingAgent(env, gamma=0.9, seed=SEED)
+        start = time.time()
+        eval_rewards, _, steps = train(
+            env,
+            NUM_STEPS,
+            agent,
+            eval_env=make_env(),
+            eval_interval=EVAL_INTERVAL,
+            plot_q=False,
+        )
+        reached = [s for s, r in zip(steps, eval_rewards) if r >= TARGET_REWARD]
+        results[name] = (reached[0] if reached else None, time.time() - start)
+
+    print(f"\n評価報酬が{TARGET_REWARD}に達した学習ステップ数")
+    for name, (step, elapse) in results.items():
+        print(f"{name:>22}: {step} step（計算時間 {elapse:.1f} s）")
@@ -1,11 +1,7 @@
-import logging
-
 import numpy as np
 from gymnasium.spaces.discrete import Discrete
 from gymnasium.utils import seeding
 
-logger = logging.getLogger(__name__)
-
 
 class QTableAgent:
     def __init__(
@@ -60,14 +56,61 @@ class QTableAgent:
         return self.rng.choice(candidates)
 
     def update(self, state, action, reward, next_state, done):
-        logger.debug(f"{state=}, {action=}, {reward=}, {next_state=}, {done=}")
         best_next = np.max(self.Q[next_state])
         td_target = reward + (0 if done else self.gamma * best_next)
         td_error = td_target - self.Q[state, action]
         self.Q[state, action] += self.alpha * td_error
+        return td_error
+
+    def update_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Apply one-step Q-learning updates for a batch of transitions at once.
+        TD errors are computed from the current table. A (state, action) pair
+        that appears several times in the batch is moved once by alpha times
+        its mean TD error, since summing k updates computed from the same table
+        would step k*alpha and diverge when k*alpha > 2.
+        """
+        best_next = np.max(self.Q[next_states], axis=1)
+        td_target = rewards + np.where(dones, 0.0, self.gamma * best_next)
+        td_error = td_target - self.Q[states, actions]
+        pairs = np.asarray(states) * self.action_space_size + np.asarray(actions)
+        unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+        mean_td = np.bincount(inverse, weights=td_error) / np.bincount(inverse)
+        self.Q.flat[unique_pairs] += self.alpha * mean_td
+        return td_error
 
     def save_q(self, path):
         np.save(path, self.Q)
 
     def load_q(self, path):
         self.Q = np.load(path)
+
+
+def check_update_batch(
+    num_repeats: int = 40, num_epochs: int = 200, alpha: float = 0.1
+) -> None:
+    """
+    Check that update_batch converges to the same Q as sequential update when
+    a transition repeats many times in a batch (as in robot recordings).
+    """
+    space = Discrete(2)
+    states = np.zeros(num_repeats, dtype=np.int64)
+    actions = np.zeros(num_repeats, dtype=np.int64)
+    rewards = np.ones(num_repeats)
+    next_states = np.ones(num_repeats, dtype=np.int64)
+    dones = np.zeros(num_repeats, dtype=bool)
+
+    sequential = QTableAgent(space, space, alpha=alpha)
+    batch = QTableAgent(space, space, alpha=alpha)
+    for _ in range(num_epochs):
+        for i in range(num_repeats):
+            sequential.update(states[i], actions[i], rewards[i], next_states[i], False)
+        batch.update_batch(states, actions, rewards, next_states, dones)
+    assert np.allclose(batch.Q, sequential.Q, atol=1e-3), (batch.Q, sequential.Q)
+
+
+if __name__ == "__main__":
+    # update_batchと逐次のupdateの結果が一致するか確認する
+    # python q_learning.py
+    check_update_batch()
+    print("update_batch matches sequential update")
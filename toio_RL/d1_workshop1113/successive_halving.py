@@ -0,0 +1,221 @@
+import csv
+import itertools
+import os
+import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 探索するパラメータ（QTableAgent / OfflineEnvの引数名）
+PARAM_NAMES = ("epsilon", "alpha", "gamma", "goal_reward", "life_range")
+
+
+def grid_configs(space: Dict[str, Sequence]) -> List[Dict[str, Any]]:
+    """All combinations of the values in `space`."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def sample_configs(
+    space: Dict[str, Sequence], n: int, seed: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    n distinct configs drawn uniformly from the combinations in `space`
+    (all of them if there are n or fewer).
+    """
+    configs = grid_configs(space)
+    return random.Random(seed).sample(configs, min(n, len(configs)))
+
+
+class SuccessiveHalving:
+    """
+    Successive halving over training configs of QTableAgent on OfflineEnv.
+    Every config is trained for min_steps, then only the top 1/eta by eval
+    score survive and continue from their saved Q table until they have been
+    trained eta times longer, and so on until one config is left.
+    Trials of a rung run in parallel on a local process pool.
+
+    The score is the exact expected number of target reaches in eval_steps
+    steps (markov_eval) on a common eval env, i.e. the eval reward divided
+    by goal_reward, so configs with different rewards and life ranges are
+    ranked on the same scale and without rollout noise.
+    """
+
+    def __init__(
+        self,
+        configs: List[Dict[str, Any]],
+        log_dir: Path,
+        min_steps: int = 10**4,
+        eta: int = 3,
+        max_steps: Optional[int] = None,
+        eval_life_range: Tuple[int, int] = (35, 36),
+        eval_steps: int = 100,
+        max_workers: Optional[int] = None,
+        seed: int = 0,
+    ):
+        """
+        configs: PARAM_NAMESをキーに持つ辞書のリスト（足りないキーは既定値）
+        log_dir: Qテーブル，リーダーボード，最良のQテーブルの書き出し先
+        min_steps: 最初の段で全ての設定を学習させるステップ数
+        eta: 各段で残す割合の逆数．次の段では学習ステップ数の合計がeta倍になる
+        max_steps: 1つの設定を学習させるステップ数の上限（Noneなら上限なし）
+        eval_life_range: 評価時の目標の寿命（全ての設定で共通）
+        """
+        if eta < 2:
+            raise ValueError("eta must be 2 or more")
+        unknown = {name for config in configs for name in config} - set(PARAM_NAMES)
+        if unknown:
+            raise ValueError(f"unknown parameters: {sorted(unknown)}")
+        self.configs = configs
+        self.log_dir = Path(log_dir)
+        self.min_steps = min_steps
+        self.eta = eta
+        self.max_steps = max_steps
+        self.eval_life_range = eval_life_range
+        self.eval_steps = eval_steps
+        self.max_workers = max_workers
+        self.seed = seed
+        self.leaderboard: List[Dict[str, Any]] = []
+
+    def run(self) -> Dict[str, Any]:
+        """Run all rungs, write leaderboard.csv and winner.npy, and return the winner row."""
+        os.makedirs(self.log_dir, exist_ok=True)
+        rows = [
+            {"trial": i, **config, "rung": -1, "steps": 0, "score": None}
+            for i, config in enumerate(self.configs)
+        ]
+        alive = list(range(len(rows)))
+        rung = 0
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            while alive:
+                budget = self.min_steps * self.eta**rung
+                if self.max_steps is not None:
+                    budget = min(budget, self.max_steps)
+                print(f"rung {rung}: {len(alive)} trials, {budget} steps each")
+                futures = [
+                    pool.submit(
+                        _run_trial,
+                        self.configs[i],
+                        budget - rows[i]["steps"],
+                        self._q_path(i) if rows[i]["steps"] > 0 else None,
+                        self._q_path(i),
+                        self.eval_life_range,
+                        self.eval_steps,
+                        self.seed + i,
+                    )
+                    for i in alive
+                ]
+                for i, future in zip(alive, futures):
+                    rows[i].update(rung=rung, steps=budget, score=future.result())
+
+                alive.sort(key=lambda i: rows[i]["score"], reverse=True)
+                n_keep = len(alive) // self.eta
+                if n_keep == 0 or budget == self.max_steps:
+                    break
+                alive = alive[:n_keep]
+                rung += 1
+
+        # 到達した段が深い順，同じ段ではスコア順
+        self.leaderboard = sorted(
+            rows, key=lambda r: (r["rung"], r["score"]), reverse=True
+        )
+        self._write_leaderboard()
+        winner = self.leaderboard[0]
+        shutil.copyfile(self._q_path(winner["trial"]), self.log_dir / "winner.npy")
+        return winner
+
+    # ----- private methods -----
+
+    def _q_path(self, trial: int) -> Path:
+        return self.log_dir / f"trial{trial:03d}.npy"
+
+    def _write_leaderboard(self) -> None:
+        columns = ["trial", *PARAM_NAMES, "rung", "steps", "score"]
+        with open(self.log_dir / "leaderboard.csv", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval="")
+            writer.writeheader()
+            writer.writerows(self.leaderboard)
+
+
+def _run_trial(
+    config, num_steps, q_in, q_out, eval_life_range, eval_steps, seed
+) -> float:
+    """Train one config for num_steps (resuming from q_in) and return its score."""
+    from demo2_train import train
+    from markov_eval import GridMarkovModel
+    from offline_env import OfflineEnv
+    from q_learning import QTableAgent
+
+    goal_reward = config.get("goal_reward", 1.0)
+    env = OfflineEnv(
+        life_range=config.get("life_range", (1, 6)), goal_reward=goal_reward
+    )
+    env.reset(seed=seed)
+    eval_env = OfflineEnv(life_range=eval_life_range, goal_reward=goal_reward)
+    agent = QTableAgent(
+        env.observation_space,
+        env.action_space,
+        alpha=config.get("alpha", 0.1),
+        gamma=config.get("gamma", 0.99),
+        epsilon=config.get("epsilon", 0.1),
+        seed=seed,
+    )
+    if q_in is not None:
+        agent.load_q(q_in)
+    eval_rewards, _, _ = train(
+        env,
+        num_steps,
+        agent,
+        eval_env,
+        eval_interval=num_steps,
+        eval_steps=eval_steps,
+        log_q=q_out,
+        plot_q=False,
+        exact_eval=GridMarkovModel.from_env(eval_env),
+    )
+    return eval_rewards[-1] / goal_reward
+
+
+if __name__ == "__main__":
+    """
+    学習パラメータをsuccessive halvingで探索する
+    python successive_halving.py
+    結果はlog/sh_<日時>/leaderboard.csvとwinner.npy
+    """
+    from datetime import datetime
+
+    # 探索するパラメータの候補
+    SPACE = {
+        "epsilon": [0.05, 0.1, 0.2, 0.3],
+        "alpha": [0.05, 0.1, 0.3, 0.5],
+        "gamma": [0.8, 0.9, 0.95, 0.99],
+        "goal_reward": [1.0, 1000],
+        "life_range": [(35, 36), (1, 6)],
+    }
+    # 試す設定の数（Noneなら全ての組み合わせ）
+    NUM_CONFIGS = 27
+    MIN_STEPS = 10**4
+    ETA = 3
+    MAX_STEPS = 10**6
+    EVAL_LIFE_RANGE = (35, 36)
+    SEED = 0
+
+    configs = (
+        grid_configs(SPACE)
+        if NUM_CONFIGS is None
+        else sample_configs(SPACE, NUM_CONFIGS, seed=SEED)
+    )
+    time_str = datetime.now().strftime("%Y_%m%d_%H%M%S")
+    scheduler = SuccessiveHalving(
+        configs,
+        Path("log") / f"sh_{time_str}",
+        min_steps=MIN_STEPS,
+        eta=ETA,
+        max_steps=MAX_STEPS,
+        eval_life_range=EVAL_LIFE_RANGE,
+        seed=SEED,
+    )
+    winner = scheduler.run()
+    print(f"winner: {winner}")
+    print(f"leaderboard: {scheduler.log_dir / 'leaderboard.csv'}")
@@ -0,0 +1,44 @@
+from offline_env import OfflineEnv
+from q_learning import QTableAgent
+from toio_RL.common.tracing import Tracer
+
+
+def make_tracer(capacity: int = 10**6) -> Tracer:
+    """
+    Tracer with probes on the training hot paths. Fields of each event:
+    QTableAgent.update:         a=state, b=action, c=next_state, value=td_error
+    QTableAgent.select_action:  a=state, b=action
+    OfflineEnv.step:            a=action, b=observation, c=target life, value=reward
+    OfflineEnv._respawn_target: a=target cell, b=target life, c=agent cell
+    Pass the training agent and env to Tracer.enable(instances=...) to leave
+    out calls on other instances such as eval_env.
+    """
+    tracer = Tracer(capacity)
+    tracer.probe(QTableAgent, "update", _update_fields)
+    tracer.probe(QTableAgent, "select_action", _select_action_fields)
+    tracer.probe(OfflineEnv, "step", _step_fields)
+    tracer.probe(OfflineEnv, "_respawn_target", _respawn_fields)
+    return tracer
+
+
+# 引数名はトレースするメソッドと同じにする（Tracer.probeを参照）
+def _update_fields(td_error, self, state, action, reward, next_state, done):
+    return state, action, next_state, td_error
+
+
+def _select_action_fields(action, self, state):
+    return state, action, -1, 0.0
+
+
+def _step_fields(result, self, action):
+    observation, reward = result[0], result[1]
+    return action, observation, self._target_life, reward
+
+
+def _respawn_fields(_, self):
+    return (
+        self.pos_to_index(self._target_pos),
+        self._target_life,
+        self.pos_to_index(self._agent_pos),
+        0.0,
+    )
@@ -0,0 +1,213 @@
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+import numpy as np
+
+MAGIC = b"TRL1"
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype(
+    [("magic", "S4"), ("version", "<u4"), ("record_size", "<u4"), ("count", "<u8")]
+)
+RECORD_DTYPE = np.dtype(
+    [
+        ("state", "<i4"),
+        ("action", "<i1"),
+        ("flags", "u1"),
+        ("reward", "<f4"),
+        ("next_state", "<i4"),
+        ("t_cmd", "<f8"),
+        ("t_obs", "<f8"),
+    ]
+)
+
+# flagsのビット
+FLAG_POSITION_LOST = 1  # 座標を読み取れていないtoioがあった
+FLAG_NOT_ARRIVED = 2  # 移動指令を出したが，目標セルへの到達を確認できなかった
+FLAG_WALL = 4  # 壁に向かう行動で，移動指令を出さなかった
+
+
+def info_to_flags(info: Dict) -> int:
+    """Convert the info dict returned by OnlineEnv.step into record flags."""
+    flags = 0
+    if info.get("position_lost", False):
+        flags |= FLAG_POSITION_LOST
+    if not info.get("moved", True):
+        flags |= FLAG_WALL
+    elif not info.get("arrived", True):
+        flags |= FLAG_NOT_ARRIVED
+    return flags
+
+
+class TransitionRecorder:
+    """
+    Append transitions of real-robot sessions to a memory-mapped file.
+    The file is a fixed header followed by packed RECORD_DTYPE records.
+    It grows in chunks of ``chunk_records`` and the record count in the
+    header is bumped after each record, so a killed session keeps every
+    completed step. Reopening an existing file appends to it.
+    """
+
+    def __init__(self, path: Union[str, Path], chunk_records: int = 4096):
+        self.path = Path(path)
+        self.chunk_records = chunk_records
+        if self.path.exists():
+            self.count = int(_read_header(self.path)["count"])
+        else:
+            with open(self.path, "wb") as f:
+                header = np.zeros(1, dtype=HEADER_DTYPE)
+                header["magic"] = MAGIC
+                header["version"] = 1
+                header["record_size"] = RECORD_DTYPE.itemsize
+                f.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+            self.count = 0
+        self._mm = None
+        self._header = None
+        self._records = None
+        self._map(self.count + chunk_records)
+
+    def record(self, state, action, reward, next_state, info: Dict) -> None:
+        if self.count == len(self._records):
+            self._map(self.count + self.chunk_records)
+        self._records[self.count] = (
+            state,
+            action,
+            info_to_flags(info),
+            reward,
+            next_state,
+            info.get("t_cmd", 0.0),
+            info.get("t_obs", 0.0),
+        )
+        self.count += 1
+        self._header["count"] = self.count
+
+    def close(self) -> None:
+        if self._mm is None:
+            return
+        self._unmap()
+        # 未使用の領域を切り詰める
+        os.truncate(self.path, HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _exc_type, _exc_value, _traceback):
+        self.close()
+
+    # ----- private methods -----
+
+    def _map(self, capacity: int) -> None:
+        # マップしたままファイルサイズを変えられないOSがあるため，一度解放してから広げる
+        self._unmap()
+        size = HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+        os.truncate(self.path, size)
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(size,))
+        self._header = self._mm[: HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        self._records = self._mm[HEADER_SIZE:].view(RECORD_DTYPE)
+
+    def _unmap(self) -> None:
+        if self._mm is None:
+            return
+        self._mm.flush()
+        self._mm = None
+        self._header = None
+        self._records = None
+
+
+def _read_header(path: Union[str, Path]) -> np.ndarray:
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]
+    if header["magic"] != MAGIC or header["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a transition record file")
+    return header
+
+
+def load_transitions(path: Union[str, Path]) -> np.ndarray:
+    """Map the recorded transitions of a file as a read-only record array."""
+    count = int(_read_header(path)["count"])
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(
+        path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,)
+    )
+
+
+def iter_batches(
+    paths: Iterable[Union[str, Path]],
+    batch_size: int = 1024,
+    skip_flags: int = FLAG_POSITION_LOST,
+):
+    """Stream recorded transitions in batches, dropping records with skip_flags."""
+    for path in paths:
+        records = load_transitions(path)
+        for start in range(0, len(records), batch_size):
+            batch = records[start : start + batch_size]
+            yield batch[(batch["flags"] & skip_flags) == 0]
+
+
+def replay(agent, paths, epochs: int = 1, batch_size: int = 1024) -> int:
+    """Train a QTableAgent on recorded transitions. Returns the number of updates."""
+    n_updates = 0
+    for _ in range(epochs):
+        for batch in iter_batches(paths, batch_size):
+            agent.update_batch(
+                batch["state"],
+                batch["action"],
+                batch["reward"],
+                batch["next_state"],
+                np.zeros(len(batch), dtype=bool),
+            )
+            n_updates += len(batch)
+    return n_updates
+
+
+def evaluate(Q: np.ndarray, paths) -> Dict[str, float]:
+    """Summarize recorded transitions and how often Q's greedy actions match them."""
+    records = np.concatenate([np.asarray(load_transitions(p)) for p in paths])
+    valid = records[(records["flags"] & FLAG_POSITION_LOST) == 0]
+    q_rows = Q[valid["state"]]
+    is_greedy = q_rows[np.arange(len(valid)), valid["action"]] == q_rows.max(axis=1)
+    duration = records["t_obs"] - records["t_cmd"]
+    return {
+        "transitions": len(records),
+        "position_lost": int(np.count_nonzero(records["flags"] & FLAG_POSITION_LOST)),
+        "not_arrived": int(np.count_nonzero(records["flags"] & FLAG_NOT_ARRIVED)),
+        "mean_reward": float(valid["reward"].mean()) if len(valid) else 0.0,
+        "greedy_agreement": float(is_greedy.mean()) if len(valid) else 0.0,
+        "mean_step_sec": float(duration.mean()) if len(records) else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    """
+    使い方
+    記録からQを学習: python transition_recorder.py replay log/*.trl --q-out q_replay.npy
+    記録を評価:     python transition_recorder.py eval log/*.trl --q q_replay.npy
+    """
+    from gymnasium.spaces import Discrete
+
+    from q_learning import QTableAgent
+
+    parser = argparse.ArgumentParser(description="Replay recorded transitions")
+    parser.add_argument("command", choices=("replay", "eval"))
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--q", help="Q table (.npy) to start from / evaluate")
+    parser.add_argument("--q-out", default="q_replay.npy")
+    parser.add_argument("--n-states", type=int, default=35 * 35)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--alpha", type=float, default=0.1)
+    parser.add_argument("--gamma", type=float, default=0.9)
+    args = parser.parse_args()
+
+    agent = QTableAgent(
+        Discrete(args.n_states), Discrete(4), alpha=args.alpha, gamma=args.gamma
+    )
+    if args.q is not None:
+        agent.load_q(args.q)
+    if args.command == "replay":
+        n = replay(agent, args.paths, epochs=args.epochs)
+        agent.save_q(args.q_out)
+        print(f"{n} updates, saved to {args.q_out}")
+    else:
+        for key, value in evaluate(agent.Q, args.paths).items():
+            print(f"{key}: {value}")
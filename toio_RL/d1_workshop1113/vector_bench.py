@@ -0,0 +1,74 @@
+import os
+import time
+from functools import partial
+
+import gymnasium as gym
+import numpy as np
+
+from offline_env import ENV_ID
+
+
+def make_vec_env(num_envs: int, asynchronous: bool, **env_kwargs):
+    """
+    Vectorize OfflineEnv. The async version steps each env in its own process
+    and receives observations through shared memory.
+    """
+    env_fns = [partial(gym.make, ENV_ID, **env_kwargs) for _ in range(num_envs)]
+    if asynchronous:
+        return gym.vector.AsyncVectorEnv(env_fns, shared_memory=True)
+    return gym.vector.SyncVectorEnv(env_fns)
+
+
+def verify(num_envs: int = 4, num_steps: int = 1000, seed: int = 0, **env_kwargs):
+    """Check that sync and async vectorization produce identical rollouts."""
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, 4, size=(num_steps, num_envs))
+    rollouts = []
+    for asynchronous in (False, True):
+        envs = make_vec_env(num_envs, asynchronous, **env_kwargs)
+        obs, _ = envs.reset(seed=seed)
+        observations, rewards = [obs], []
+        for action in actions:
+            obs, reward, *_ = envs.step(action)
+            observations.append(obs)
+            rewards.append(reward)
+        envs.close()
+        rollouts.append((np.array(observations), np.array(rewards)))
+    (sync_obs, sync_rwd), (async_obs, async_rwd) = rollouts
+    assert np.array_equal(sync_obs, async_obs), "observations differ"
+    assert np.array_equal(sync_rwd, async_rwd), "rewards differ"
+
+
+def throughput(
+    num_envs: int, asynchronous: bool, num_steps: int = 10**4, **env_kwargs
+) -> float:
+    """Returns env steps per second (num_envs steps per vector step)."""
+    envs = make_vec_env(num_envs, asynchronous, **env_kwargs)
+    envs.reset(seed=0)
+    actions = np.random.default_rng(0).integers(0, 4, size=(num_steps, num_envs))
+    start = time.perf_counter()
+    for action in actions:
+        envs.step(action)
+    elapsed = time.perf_counter() - start
+    envs.close()
+    return num_steps * num_envs / elapsed
+
+
+if __name__ == "__main__":
+    """
+    SyncVectorEnvとAsyncVectorEnvの結果の一致を確認し，スループットを比較する
+    python vector_bench.py
+    """
+    ENV_KWARGS = {"life_range": (35, 36), "goal_reward": 1.0}
+    NUM_STEPS = 10**4
+
+    verify(**ENV_KWARGS)
+    print("sync/async rollouts match")
+
+    num_cpus = os.cpu_count() or 1
+    print(f"cpu: {num_cpus}")
+    print(f"{'num_envs':>8} {'sync [step/s]':>14} {'async [step/s]':>15}")
+    for num_envs in sorted({1, 2, 4, num_cpus}):
+        sync_sps = throughput(num_envs, False, NUM_STEPS, **ENV_KWARGS)
+        async_sps = throughput(num_envs, True, NUM_STEPS, **ENV_KWARGS)
+        print(f"{num_envs:>8} {sync_sps:>14.0f} {async_sps:>15.0f}")